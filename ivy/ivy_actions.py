@@ -15,6 +15,7 @@ from . import ivy_ast
 from .ivy_ast import AST, compose_atoms, MixinAfterDef
 from . import ivy_module
 from . import ivy_utils as iu
+import weakref
 
 def p_c_a(s):
     a = s.split(':')
@@ -24,6 +25,12 @@ checked_assert = iu.Parameter("assert","",check=lambda s: len(s.split(':'))==2,
                               process=p_c_a)
 check_unprovable = iu.BooleanParameter("unprovable",False)
 
+# With update_cache=true, the update of a called action is computed
+# once per domain and evaluation context, and reused at each call
+# site, renaming the formal parameters.
+
+opt_update_cache = iu.BooleanParameter("update_cache",False)
+
 class Schema(AST):
     def __init__(self,defn):
         self.defn,self.fresh = defn,[]
@@ -93,6 +100,33 @@ class SymExContext(object):
         return False # don't block any exceptions
 
 symex_params = []
+
+class AssertMarkerContext(object):
+    """ Context Manager in which the failure condition of each checked
+    assertion is conjoined with a boolean marker symbol for its line
+    number, and the assertion is assumed when it passes. The failure
+    of any one assertion can then be selected from a single symbolic
+    execution by asserting its marker and negating the others. """
+    def __init__(self):
+        self.markers = dict()
+    def __enter__(self):
+        global assert_markers
+        self.old_markers = assert_markers
+        assert_markers = self
+        return self
+    def __exit__(self,exc_type, exc_val, exc_tb):
+        global assert_markers
+        assert_markers = self.old_markers
+        return False # don't block any exceptions
+    def marker(self,lineno):
+        if lineno not in self.markers:
+            self.markers[lineno] = Symbol('assert$fail{}'.format(len(self.markers)),RelationSort([]))
+        return self.markers[lineno]
+    def select(self,lineno):
+        """ Returns a formula selecting failures of the assertion at lineno """
+        return And(*[(s if l == lineno else Not(s)) for l,s in self.markers.items()])
+
+assert_markers = None
     
 class SymbolList(AST):
     def __init__(self,*symbols):
@@ -358,6 +392,9 @@ class AssertAction(Action):
     
         cl = formula_to_clauses(dual_formula(fmla))
 #        return ([],formula_to_clauses_tseitin(self.args[0]),cl)
+        if assert_markers is not None:
+            cl = Clauses(cl.fmlas+[assert_markers.marker(self.lineno)],cl.defs,EmptyAnnotation())
+            return ([],formula_to_clauses(fmla,annot = EmptyAnnotation()),cl)
         cl = Clauses(cl.fmlas,cl.defs,EmptyAnnotation())
         return ([],true_clauses(annot = EmptyAnnotation()),cl)
     def assert_to_assume(self,kinds):
@@ -1173,6 +1210,31 @@ class NativeAction(Action):
         
 call_action_ctr = 0
 
+# Map from domain to map from callee key to update of callee. See
+# CallAction.callee_update.
+
+update_caches = weakref.WeakKeyDictionary()
+
+def rename_update(update,subst):
+    """ Rename symbols in an update. Here, subst is a dict from symbols
+    to symbols, and updated symbols are renamed in the post-state as well. """
+    if not subst:
+        return update
+    syms = dict(subst)
+    syms.update((new(s),new(t)) for s,t in subst.items() if s in update[0])
+    return ([subst.get(s,s) for s in update[0]],
+            rename_clauses(update[1],syms),
+            rename_clauses(update[2],syms))
+
+class UpdateAction(object):
+    """ An action with a precomputed update """
+    def __init__(self,update):
+        self.update = update
+    def int_update(self,domain,pvars):
+        return self.update
+    def __str__(self):
+        return 'update'
+
 class BindOldsAction(Action):
     def int_update(self,domain,pvars):
         return bind_olds_action(self.args[0].int_update(domain,pvars))
@@ -1225,7 +1287,11 @@ class CallAction(Action):
 #        print "apply_actuals: subst: {}".format(subst)
         formal_params = [subst[s] for s in  v.formal_params] # rename to prevent capture
         formal_returns = [subst[s] for s in v.formal_returns] # rename to prevent capture
-        v = substitute_constants_ast(v,subst)
+        cached = self.callee_update(domain,pvars,v)
+        if cached is not None:
+            body = UpdateAction(rename_update(cached,subst))
+        else:
+            body = BindOldsAction(substitute_constants_ast(v,subst))
 #        print "formal_params: {}".format(formal_params)
 #        print "formal_returns: {}".format(formal_returns)
 #        print "substituted called action: {}".format(v)
@@ -1246,12 +1312,25 @@ class CallAction(Action):
                 raise IvyError(self,"value for output parameter {} has wrong sort".format(x))
         input_asgns = [AssignAction(x,y) for x,y in zip(formal_params,actual_params)]
         output_asgns = [AssignAction(y,x) for x,y in zip(formal_returns,actual_returns)]
-        res = Sequence(Sequence(*input_asgns),BindOldsAction(v),Sequence(*output_asgns))
+        res = Sequence(Sequence(*input_asgns),body,Sequence(*output_asgns))
         res = res.int_update(domain,pvars)
 #        print "call update: {}".format(res)
         res = hide(formal_params+formal_returns,res)
 #        print "after hide: {}".format(res)
         return res
+    def callee_update(self,domain,pvars,v):
+        """ Returns the update of callee v in terms of its formals, from
+        the update cache, or None if the cache is not in use. The key
+        includes the evaluation context and the settings affecting
+        assertions. """
+        if not opt_update_cache.get() or determinize:
+            return None
+        key = (v,context,tuple(pvars),assert_markers,str(checked_assert.get()),
+               check_unprovable.get(),len(domain.updates))
+        cache = update_caches.setdefault(domain,dict())
+        if key not in cache:
+            cache[key] = BindOldsAction(v).int_update(domain,pvars)
+        return cache[key]
     def prefix_calls(self,pref):
         res = CallAction(*([self.args[0].prefix(pref) if isinstance(pref,str)
                             else self.args[0].rename(pref(self.args[0].rep))] + self.args[1:]))
@@ -16,28 +16,154 @@ from . import ivy_ast
 from . import ivy_proof
 from . import ivy_trace
 from . import ivy_interp
+from . import ivy_profile
+from . import ivy_solver as slv
+import ivy.z3 as z3
 
-def check_isolate(n_steps,n_unroll=None):
+import multiprocessing
+import sys
 
-    if n_unroll is not None:
-        old_actions = im.module.actions
+# With incremental_bmc=true, a single solver is used for all depths.
 
-        im.module.actions = dict()
-        for actname,action in old_actions.items():
-            im.module.actions[actname] = action.unroll_loops(lambda x: n_unroll)
-    
-    step_action = ia.env_action(None)
+opt_incremental_bmc = iu.BooleanParameter("incremental_bmc",False)
+
+# Options for method kind[k]: with simple_path=true, the states in the
+# inductive step are required to be distinct, and with
+# kind_parallel=true, the base case and inductive step are checked in
+# parallel.
+
+opt_simple_path = iu.BooleanParameter("simple_path",False)
+opt_kind_parallel = iu.BooleanParameter("kind_parallel",True)
 
-    conjectures = im.module.conjs
-    conj = ilu.and_clauses(*conjectures)
+class Unrolling(object):
+    """ Unrolling of a transition relation in a single solver. The
+    symbols updated by the transition relation are renamed apart at
+    each step, while other symbols are shared by all steps. Each check
+    is made under its own activation literal, so the solver keeps
+    what it has learned about the unrolling from one depth to the
+    next. """
+    def __init__(self,init,update,axioms):
+        self.updated,self.trans,self.fail = update
+        self.step_axioms = ilu.clauses_using_symbols(self.updated,axioms)
+        self.solver = slv.base_solver(ilu.and_clauses(init,axioms))
+        self.cur = dict() # map from updated symbols to their names at current step
+        self.frames = [self.cur]
+        self.depth = 0
+    def rename(self,clauses,tag,post=dict()):
+        """ Renames clauses to the current step. Updated symbols are
+        renamed to their current names, symbols new(x) according to
+        post, and skolems apart using tag. """
+        rn = dict(self.cur)
+        rn.update((tr.new(x),y) for x,y in post.items())
+        for sym in ilu.used_symbols_clauses(clauses):
+            if tr.is_skolem(sym) and not tr.is_global_skolem(sym) and sym not in rn:
+                rn[sym] = sym.prefix('__bmc{}{}_'.format(self.depth,tag))
+        return ilu.rename_clauses(clauses,rn)
+    def post_names(self,tag):
+        return dict((x,x.prefix('__bmc{}{}_'.format(self.depth+1,tag))) for x in self.updated)
+    def check(self,clauses,tag,post=dict()):
+        """ Checks whether clauses can hold at the current step """
+        lit = z3.Bool('__bmc$act{}{}'.format(self.depth,tag))
+        self.solver.add(z3.Implies(lit,slv.clauses_to_z3(self.rename(clauses,tag,post))))
+        start_time = ivy_profile.timer()
+        res = slv.decide(self.solver,[lit])
+        if ivy_profile.enabled():
+            ivy_profile.record('bmc',ivy_profile.timer()-start_time,res,clauses=[clauses],solver=self.solver)
+        return res == z3.sat
+    def check_fail(self):
+        """ Checks whether the transition relation can fail at the current step """
+        return self.check(self.fail,'f',self.post_names('f'))
+    def assume(self,clauses,tag):
+        """ Assumes clauses at the current step """
+        self.solver.add(slv.clauses_to_z3(self.rename(clauses,tag)))
+    def step(self):
+        post = self.post_names('')
+        self.solver.add(slv.clauses_to_z3(self.rename(self.trans,'t',post)))
+        self.cur = dict(self.cur)
+        self.cur.update(post)
+        self.frames.append(self.cur)
+        self.depth += 1
+        self.solver.add(slv.clauses_to_z3(self.rename(self.step_axioms,'a')))
+    def assume_distinct(self):
+        """ Assumes that the state at the current step differs from the
+        states at all previous steps (the simple path condition). """
+        for frame in self.frames[:-1]:
+            diffs = [state_diff(sym,frame.get(sym,sym),self.cur.get(sym,sym)) for sym in self.updated]
+            self.solver.add(slv.formula_to_z3(il.Or(*diffs)))
+
+def state_diff(sym,x,y):
+    """ Returns a formula stating that the values x and y of symbol
+    sym differ """
+    if not sym.sort.dom:
+        return il.Not(il.Equals(x,y))
+    vs = ilu.sym_placeholders(sym)
+    return il.Exists(vs,il.Not(il.Equals(x(*vs),y(*vs))))
+
+def report(n,res):
+    print('BMC with bound {} found a counter-example...'.format(n))
+    print()
+    print(res)
+    exit(0)
+
+def check_incremental(ag,post,step_action,clauses,n_steps):
+    """ Checks for a counterexample of depth at most n_steps from
+    state post. Returns the depth and trace of the counterexample, or
+    None. """
+    init = ag.get_history(post).post
+    update = step_action.update(im.module,{})
+    unr = Unrolling(init,update,im.module.background_theory())
+    for n in range(n_steps + 1):
+        print('Checking invariants at depth {}...'.format(n))
+        with ivy_profile.ProfileContext(action='bmc',depth=n):
+            found = unr.check(clauses,'c')
+        if found:
+            return n,counterexample(ag,post,step_action,n,clauses)
+        with ivy_profile.ProfileContext(action='bmc',depth=n+1):
+            found = unr.check_fail()
+        if found:
+            return n+1,counterexample(ag,post,step_action,n+1,None)
+        if n < n_steps:
+            unr.step()
+    return None
+
+def counterexample(ag,post,step_action,n,clauses):
+    """ Rebuilds a counterexample of depth n found by the incremental
+    check, in the same way as the non-incremental check, so the trace
+    is the same. If clauses is None, the counterexample is a failure
+    of the last step. """
+    for i in range(n):
+        with ivy_interp.EvalContext(False):
+            post = ag.execute(step_action)
+    if clauses is None:
+        post = ivy_interp.State(expr = ivy_interp.fail_expr(post.expr))
+        clauses = ilu.true_clauses()
+    res = ivy_trace.check_final_cond(ag,post,clauses,[],True)
+    assert res is not None
+    return res
+
+def unroll_loops(n_unroll):
+    """ Unrolls the loops in all actions n_unroll times. Returns the
+    original actions. """
+    old_actions = im.module.actions
+    im.module.actions = dict()
+    for actname,action in old_actions.items():
+        im.module.actions[actname] = action.unroll_loops(lambda x: n_unroll)
+    return old_actions
+
+def negated_conjectures():
+    """ Returns the conjectures, and clauses that hold in states
+    violating the conjectures """
+    conj = ilu.and_clauses(*im.module.conjs)
 
     used_names = frozenset(x.name for x in list(il.sig.symbols.values()))
     def witness(v):
         c = lg.Const('@' + v.name, v.sort)
         assert c.name not in used_names
         return c
-    clauses = ilu.dual_clauses(conj, witness)
+    return conj,ilu.dual_clauses(conj, witness)
 
+def initial_state():
+    """ Returns an analysis graph and its state after initialization """
     ag = art.AnalysisGraph()
     with ag.context as ac:
 #                post = ac.new_state(ag.init_cond)
@@ -46,24 +172,114 @@ def check_isolate(n_steps,n_unroll=None):
     if 'initialize' in im.module.actions:
         init_action = im.module.actions['initialize']
         post = ag.execute(init_action, None, None, 'initialize')
+    return ag,post
 
-    for n in range(n_steps + 1):
-        print('Checking invariants at depth {}...'.format(n))
-        res = ivy_trace.check_final_cond(ag,post,clauses,[],True)
-        if res is not None:
-            print('BMC with bound {} found a counter-example...'.format(n))
-            print()
-            print(res)
-            exit(0)
-        with ivy_interp.EvalContext(False):
-            post = ag.execute(step_action)
-        fail = ivy_interp.State(expr = ivy_interp.fail_expr(post.expr))
-        res = ivy_trace.check_final_cond(ag,fail,ilu.true_clauses(),[],True)
+def check_isolate(n_steps,n_unroll=None):
+
+    if n_unroll is not None:
+        old_actions = unroll_loops(n_unroll)
+    
+    step_action = ia.env_action(None)
+
+    conj,clauses = negated_conjectures()
+
+    ag,post = initial_state()
+
+    if opt_incremental_bmc.get():
+        res = check_incremental(ag,post,step_action,clauses,n_steps)
         if res is not None:
-            print('BMC with bound {} found a counter-example...'.format(n+1))
-            print()
-            print(res)
-            exit(0)
+            report(*res)
+    else:
+        for n in range(n_steps + 1):
+            print('Checking invariants at depth {}...'.format(n))
+            with ivy_profile.ProfileContext(action='bmc',depth=n):
+                res = ivy_trace.check_final_cond(ag,post,clauses,[],True)
+            if res is not None:
+                report(n,res)
+            with ivy_interp.EvalContext(False):
+                post = ag.execute(step_action)
+            fail = ivy_interp.State(expr = ivy_interp.fail_expr(post.expr))
+            with ivy_profile.ProfileContext(action='bmc',depth=n+1):
+                res = ivy_trace.check_final_cond(ag,fail,ilu.true_clauses(),[],True)
+            if res is not None:
+                report(n+1,res)
+
+    if n_unroll is not None:
+        im.module.actions = old_actions
+
+# k-induction
+#
+# The base case checks that there is no counterexample of depth less
+# than k from the initial state. The inductive step checks that from
+# any k successive states satisfying the conjectures, the next step
+# cannot fail and satisfies the conjectures. Together, these prove the
+# conjectures are invariant and no assertion fails.
+
+def check_step(k,step_action,conj,clauses):
+    """ Checks the inductive step of depth k. Returns true if it holds. """
+    update = step_action.update(im.module,{})
+    unr = Unrolling(ilu.true_clauses(),update,im.module.background_theory())
+    for n in range(k):
+        if n > 0:
+            unr.step()
+        unr.assume(conj,'i')
+        if opt_simple_path.get():
+            unr.assume_distinct()
+    with ivy_profile.ProfileContext(action='kind_step',depth=k):
+        if unr.check_fail():
+            return False
+        unr.step()
+        if opt_simple_path.get():
+            unr.assume_distinct()
+        return not unr.check(clauses,'c')
+
+kind_problem = None
+
+def kind_step_worker():
+    ivy_profile.records = []
+    return check_step(*kind_problem),ivy_profile.records
+
+def use_kind_parallel():
+    return opt_kind_parallel.get() and not multiprocessing.current_process().daemon
+
+def check_isolate_kind(k,n_unroll=None):
+    global kind_problem
+
+    if n_unroll is not None:
+        old_actions = unroll_loops(n_unroll)
+
+    step_action = ia.env_action(None)
+    conj,clauses = negated_conjectures()
+    ag,post = initial_state()
+
+    res = None
+    if use_kind_parallel():
+        kind_problem = (k,step_action,conj,clauses)
+        sys.stdout.flush() # so buffered output is not duplicated in worker
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(1) as pool:
+            step_res = pool.apply_async(kind_step_worker)
+            base_res = check_incremental(ag,post,step_action,clauses,k-1)
+            if base_res is None:
+                step_ok,records = step_res.get()
+                ivy_profile.records.extend(records)
+        kind_problem = None
+    else:
+        base_res = check_incremental(ag,post,step_action,clauses,k-1)
+        if base_res is None:
+            print('Checking inductive step...')
+            step_ok = check_step(k,step_action,conj,clauses)
+
+    if base_res is not None:
+        n,trace = base_res
+        print('k-induction base case found a counter-example of depth {}...'.format(n))
+        print()
+        res = trace
+    elif not step_ok:
+        res = 'The inductive step does not hold for k = {}. Try a larger k or strengthen the invariant.'.format(k)
+    else:
+        print('The inductive step holds for k = {}.'.format(k))
 
     if n_unroll is not None:
         im.module.actions = old_actions
+    return res
@@ -28,9 +28,18 @@ from . import ivy_l2s
 from . import ivy_mc
 from . import ivy_vmt
 from . import ivy_bmc
+from . import ivy_updr
 from . import ivy_tactics
+from . import ivy_vc_cache
+from . import ivy_profile
 
 import sys
+import io
+import os
+import json
+import hashlib
+import traceback
+import multiprocessing
 from collections import defaultdict
 
 diagnose = iu.BooleanParameter("diagnose",False)
@@ -40,6 +49,9 @@ opt_trusted = iu.BooleanParameter("trusted",False)
 opt_mc = iu.BooleanParameter("mc",False)
 opt_trace = iu.BooleanParameter("trace",False)
 opt_separate = iu.BooleanParameter("separate",None)
+opt_jobs = iu.Parameter("jobs",1,process=int)
+opt_vc_jobs = iu.Parameter("vc_jobs",1,process=int)
+opt_incremental_isolates = iu.BooleanParameter("incremental_isolates",False)
 
 def display_cex(msg,ag):
     if diagnose.get():
@@ -176,6 +188,7 @@ def get_checked_actions():
     return []
 
 failures = 0
+some_bounded = False
 
 def print_dots():
     print('...', end=' ')
@@ -349,16 +362,17 @@ def filter_fcs(fcs):
         return fcs
     return [fc for fc in fcs if (not isinstance(fc,ConjChecker) or fc.lf.lineno == check_lineno)]
 
-def check_fcs_in_state(mod,ag,post,fcs):
+def check_fcs_in_state(mod,ag,post,fcs,history=None):
 #    iu.dbg('"foo"')
-    history = ag.get_history(post)
+    if history is None:
+        history = ag.get_history(post)
 #    iu.dbg('history.actions')
     gmc = lambda cls, final_cond: itr.small_model_clauses(cls,final_cond,shrink=diagnose.get())
     axioms = im.module.background_theory()
+    ffcs = filter_fcs(fcs)
     if opt_trace.get() or diagnose.get():
         clauses = history.post
         clauses = lut.and_clauses(clauses,axioms)
-        ffcs = filter_fcs(fcs)
         model = itr.small_model_clauses(clauses,ffcs,shrink=True)
         if model is not None:
 #            iu.dbg('history.actions')
@@ -388,12 +402,91 @@ def check_fcs_in_state(mod,ag,post,fcs):
             else:
                 print(str(handler))
             exit(0)
+    elif use_vc_jobs(ffcs):
+        check_fcs_parallel(lut.and_clauses(history.post,axioms),ffcs)
     else:
-        res = history.satisfy(axioms,gmc,filter_fcs(fcs))
+        res = history.satisfy(axioms,gmc,ffcs)
         if res is not None and diagnose.get():
             show_counterexample(ag,post,res)
     return not any(fc.failed for fc in fcs)
 
+# Checking the final conditions in parallel. Each worker process
+# checks a subset of the conditions against the same history clauses,
+# together with all of the assumed conditions, in the original
+# order. The outcomes are then replayed on the checkers in the parent,
+# so that the report is the same as in the sequential case.
+
+class RecordedCheck(object):
+    """ Final condition that records the outcome of a check instead
+    of reporting it. """
+    def __init__(self,fc):
+        self.fc = fc
+        self.result = None
+    @property
+    def lf(self):
+        return getattr(self.fc,'lf',None)
+    def cond(self):
+        return self.fc.cond()
+    def start(self):
+        pass
+    def sat(self):
+        self.result = 'sat'
+        return True
+    def unsat(self):
+        self.result = 'unsat'
+        return True
+    def assume(self):
+        return self.fc.assume()
+
+def use_vc_jobs(fcs):
+    if opt_vc_jobs.get() <= 1 or diagnose.get() or islv.opt_show_vcs.get():
+        return False
+    if multiprocessing.current_process().daemon:
+        return False # already in a worker process
+    return sum(1 for fc in fcs if not fc.assume()) > 1
+
+fcs_parallel_problem = None
+
+def fcs_worker(part):
+    clauses,fcs = fcs_parallel_problem
+    recs = [RecordedCheck(fc) for idx,fc in enumerate(fcs) if fc.assume() or idx in part]
+    ivy_profile.records = []
+    ivy_vc_cache.reset_stats()
+    try:
+        itr.small_model_clauses(clauses,recs,shrink=False)
+    except iu.IvyError as e:
+        return str(e)
+    return ([(idx,rec.result) for idx,rec in zip(sorted(part),(r for r in recs if not r.assume()))],
+            ivy_profile.records,ivy_vc_cache.get_stats())
+
+def check_fcs_parallel(clauses,fcs):
+    global fcs_parallel_problem
+    checks = [idx for idx,fc in enumerate(fcs) if not fc.assume()]
+    if not checks:
+        return
+    njobs = min(opt_vc_jobs.get(),len(checks))
+    parts = [set(checks[i::njobs]) for i in range(njobs)]
+    fcs_parallel_problem = (clauses,fcs)
+    sys.stdout.flush() # so buffered output is not duplicated in workers
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(njobs) as pool:
+        results = pool.map(fcs_worker,parts)
+    fcs_parallel_problem = None
+    outcome = dict()
+    for res in results:
+        if isinstance(res,str):
+            raise WorkerError(res)
+        outcome.update(res[0])
+        ivy_profile.records.extend(res[1])
+        ivy_vc_cache.add_stats(res[2])
+    for idx,fc in enumerate(fcs):
+        fc.start()
+        if idx in outcome:
+            if outcome[idx] == 'sat':
+                fc.sat()
+            elif outcome[idx] == 'unsat':
+                fc.unsat()
+
 def check_conjs_in_state(mod,ag,post,indent=8):
     conjs = mod.conj_subgoals if mod.conj_subgoals is not None else mod.labeled_conjs
     conjs = [x for x in conjs if is_check_mod_unprovable(x)]
@@ -436,6 +529,44 @@ def apply_conj_proofs(mod):
 
 
 
+# To check the program assertions treated as guarantees, we
+# symbolically execute each exported action just once, with the
+# failure of each assertion labeled by a marker symbol (see
+# ivy_actions.AssertMarkerContext). The failure of a given assertion
+# is then checked by selecting its marker. The failure state and its
+# history are cached per exported action in "cache".
+
+def get_marked_failure(mod,root,cache):
+    if root not in cache:
+        action = act.env_action(root)
+        ag = ivy_art.AnalysisGraph()
+        pre = itp.State()
+        pre.clauses = get_conjs(mod)
+        old_checked_assert = act.checked_assert.get()
+        act.checked_assert.value = check_lineno if check_lineno is not None else ""
+        with act.AssertMarkerContext() as markers:
+            with itp.EvalContext(check=False):
+                post = ag.execute(action,prestate=pre)
+        act.checked_assert.value = old_checked_assert
+        fail = itp.State(expr = itp.fail_expr(post.expr))
+        fail.update = itr.action_failure(post.update)
+        cache[root] = (ag,fail,ag.get_history(fail),markers)
+    return cache[root]
+
+def check_guarantee(mod,root,sub,failure_cache):
+    if opt_trace.get() or diagnose.get():
+        action = act.env_action(root)
+        ag = ivy_art.AnalysisGraph()
+        pre = itp.State()
+        pre.clauses = get_conjs(mod)
+        with itp.EvalContext(check=False):
+            post = ag.execute(action,prestate=pre)
+        fail = itp.State(expr = itp.fail_expr(post.expr))
+        return check_safety_in_state(mod,ag,fail,report_pass=False)
+    ag,fail,history,markers = get_marked_failure(mod,root,failure_cache)
+    fc = Checker(lg.Not(markers.select(sub.lineno)),report_pass=False)
+    return check_fcs_in_state(mod,ag,fail,[fc],history=history)
+
 def check_isolate(trace_hook = None):
     mod = im.module
     if mod.isolate_proof is not None:
@@ -483,7 +614,8 @@ def check_isolate(trace_hook = None):
                 props = [x for x in im.module.labeled_props if not x.temporal]
                 props = [p for p in props if not(p.id in subgoalmap and p.explicit)]
                 fcs = ([(ConjAssumer if prop.assumed or prop.id in subgoalmap else ConjChecker)(prop) for prop in props])
-                check_fcs_in_state(mod,ag,pre,fcs)
+                with ivy_profile.ProfileContext(action='properties'):
+                    check_fcs_in_state(mod,ag,pre,fcs)
             else:
                 for lf in schema_instances + mod.labeled_props:
                     print(pretty_lf(lf))
@@ -528,7 +660,7 @@ def check_isolate(trace_hook = None):
         if checked_invariants and not checked_action.get() and not unprovable:
             print("\n    Initialization must establish the invariant")
             if check:
-                with itp.EvalContext(check=False):
+                with itp.EvalContext(check=False), ivy_profile.ProfileContext(action='init'):
                     ag = ivy_art.AnalysisGraph(initializer=lambda x:None)
                     check_conjs_in_state(mod,ag,ag.states[0])
             else:
@@ -546,7 +678,8 @@ def check_isolate(trace_hook = None):
                 if check:
                     ag = ivy_art.AnalysisGraph(initializer=lambda x:None)
                     fail = itp.State(expr = itp.fail_expr(ag.states[0].expr))
-                    check_safety_in_state(mod,ag,fail)
+                    with ivy_profile.ProfileContext(action='init'):
+                        check_safety_in_state(mod,ag,fail)
 
 
         checked_actions = get_checked_actions()
@@ -563,7 +696,8 @@ def check_isolate(trace_hook = None):
                     with itp.EvalContext(check=False): # don't check safety
     #                    post = ag.execute(action, pre, None, actname)
                         post = ag.execute(action, pre)
-                    check_conjs_in_state(mod,ag,post,indent=12)
+                    with ivy_profile.ProfileContext(action=actname):
+                        check_conjs_in_state(mod,ag,post,indent=12)
                 else:
                     print('')
 
@@ -593,6 +727,7 @@ def check_isolate(trace_hook = None):
                     print("            {}assumption".format(pretty_lineno(sub)))
 
         tried = set()
+        failure_cache = dict()
         some_guarants = False
         for actname,action in mod.actions.items():
             guarantees = [sub for sub in action.iter_subactions()
@@ -621,14 +756,9 @@ def check_isolate(trace_hook = None):
                         for root in checked_actions:
                             if root in roots:
                                tried.add((root,sub.lineno))
-                               action = act.env_action(root)
-                               ag = ivy_art.AnalysisGraph()
-                               pre = itp.State()
-                               pre.clauses = get_conjs(mod)
-                               with itp.EvalContext(check=False):
-                                   post = ag.execute(action,prestate=pre)
-                               fail = itp.State(expr = itp.fail_expr(post.expr))
-                               if not check_safety_in_state(mod,ag,fail,report_pass=False):
+                               with ivy_profile.ProfileContext(action=root,guarantee=sub.lineno):
+                                   ok = check_guarantee(mod,root,sub,failure_cache)
+                               if not ok:
                                    some_failed = True
                                    break
                         if not some_failed:
@@ -816,12 +946,228 @@ def mc_isolate(isolate,meth=ivy_mc.check_isolate):
                 exit(1)
             act.checked_assert.value = old_checked_assert
     
+def get_mc_engines(isolate):
+    """ Returns the model checkers to use for isolate with method
+    mc. These are the engines given by option mc_engines, and any
+    engine with a timeout given by isolate attribute
+    <engine>_timeout. """
+    def int_attr(name):
+        val = get_isolate_attr(isolate,name)
+        if val is not None and not val.isdigit():
+            raise IvyError(None,'attribute {} should be an integer. Got "{}".'.format(name,val))
+        return None if val is None else int(val)
+    engines = list(ivy_mc.opt_mc_engines.get())
+    engines.extend(e for e in sorted(ivy_mc.abc_engines)
+                   if e not in engines and int_attr(e+'_timeout') is not None)
+    return [ivy_mc.ABCModelChecker(e,timeout=int_attr(e+'_timeout'),
+                                   frames=int_attr('bmc3_frames') if e == 'bmc3' else None)
+            for e in engines]
+
 def get_isolate_method(isolate):
     if opt_mc.get():
         return 'mc'
     return get_isolate_attr(isolate,'method','ic')
 
 
+def check_one_isolate(isolate):
+    if isolate is not None and isolate in im.module.isolates:
+        idef = im.module.isolates[isolate]
+        if len(idef.verified()) == 0 or isinstance(idef,ivy_ast.TrustedIsolateDef):
+            return # skip if nothing to verify
+    fingerprint = None
+    if opt_incremental_isolates.get():
+        fingerprint = ivy_isolate.isolate_fingerprint(im.module,isolate,options_text())
+        entry = isolate_manifest.get(str(isolate))
+        if isinstance(entry,dict) and entry.get('fingerprint') == fingerprint:
+            print("\nIsolate {}: unchanged, skipped".format(isolate))
+            replay_isolate_flags(entry)
+            return
+    global some_bounded
+    old_failures = failures
+    old_flags = (some_bounded,ivy_tactics.used_sorry)
+    some_bounded = ivy_tactics.used_sorry = False
+    try:
+        check_one_isolate_aux(isolate)
+        flags = (some_bounded,ivy_tactics.used_sorry)
+    finally:
+        some_bounded = some_bounded or old_flags[0]
+        ivy_tactics.used_sorry = ivy_tactics.used_sorry or old_flags[1]
+    if fingerprint is not None and failures == old_failures and not opt_trusted.get():
+        passed_isolates[str(isolate)] = {'fingerprint':fingerprint,
+                                         'some_bounded':flags[0],
+                                         'used_sorry':flags[1]}
+
+def replay_isolate_flags(entry):
+    """ Sets the flags that a skipped isolate set when it was checked,
+    so that the final report is the same as if it were checked. """
+    global some_bounded
+    if entry.get('some_bounded'):
+        some_bounded = True
+    if entry.get('used_sorry'):
+        ivy_tactics.used_sorry = True
+
+def check_one_isolate_aux(isolate):
+    if isolate:
+        print("\nIsolate {}:".format(isolate))
+    if isolate is not None and iu.compose_names(isolate,'macro_finder') in im.module.attributes:
+        save_macro_finder = islv.opt_macro_finder.get()
+        if save_macro_finder:
+            print("Turning off macro_finder")
+            islv.set_macro_finder(False)
+    with im.module.copy():
+        ivy_isolate.create_isolate(isolate) # ,ext='ext'
+        if opt_trusted.get():
+            return
+        method_name = get_isolate_method(isolate)
+        if method_name == 'mc':
+            mc_isolate(isolate,lambda : ivy_mc.check_isolate(engines=get_mc_engines(isolate)))
+        elif method_name == 'vmt':
+            mc_isolate(isolate,meth=ivy_vmt.check_isolate)
+        elif method_name.startswith('bmc['):
+            global some_bounded
+            some_bounded = True
+            _,prms = iu.parse_int_subscripts(method_name)
+            if len(prms) < 1 or len(prms) > 2:
+                raise IvyError(None,'BMC method specifier should be bmc[<steps>] or bmc[<steps>][<unroll>]. Got "{}".'.format(method_name))
+            mc_isolate(isolate,lambda : ivy_bmc.check_isolate(prms[0],n_unroll = prms[1] if len(prms) >= 2 else None))
+        elif method_name.startswith('kind['):
+            _,prms = iu.parse_int_subscripts(method_name)
+            if len(prms) < 1 or len(prms) > 2 or prms[0] < 1:
+                raise IvyError(None,'k-induction method specifier should be kind[<k>] or kind[<k>][<unroll>] with k > 0. Got "{}".'.format(method_name))
+            mc_isolate(isolate,lambda : ivy_bmc.check_isolate_kind(prms[0],n_unroll = prms[1] if len(prms) >= 2 else None))
+        elif method_name == 'pdr' or method_name.startswith('pdr['):
+            _,prms = iu.parse_int_subscripts(method_name)
+            if len(prms) > 1:
+                raise IvyError(None,'PDR method specifier should be pdr or pdr[<frames>]. Got "{}".'.format(method_name))
+            mc_isolate(isolate,lambda : ivy_updr.check_isolate(prms[0] if prms else None))
+        else:
+            logic = get_isolate_attr(isolate,'complete',None)
+            if logic is not None:
+                im.module.logics = [logic]
+            check_isolate()
+    if isolate is not None and iu.compose_names(isolate,'macro_finder') in im.module.attributes:
+        if save_macro_finder:
+            print("Turning on macro_finder")
+            islv.set_macro_finder(True)
+
+# For incremental checking, we keep a manifest of the fingerprints of
+# the isolates that passed in previous runs (see
+# ivy_isolate.isolate_fingerprint). An isolate whose fingerprint is
+# unchanged is skipped. Each entry also records whether the isolate
+# was only checked up to a bound or used 'sorry', so that a skipped
+# isolate is reported the same way. The manifest is stored in the VC
+# cache directory.
+
+isolate_manifest = dict()
+passed_isolates = dict()
+
+# Parameters that cannot affect the result of a check
+fingerprint_ignored_params = set(['jobs','vc_jobs','vc_cache','vc_cache_dir','incremental_isolates','profile'])
+
+def options_text():
+    return ';'.join('{}={}'.format(key,iu.registry[key].get()) for key in sorted(iu.registry)
+                    if key not in fingerprint_ignored_params)
+
+def manifest_path():
+    name = hashlib.sha256(os.path.abspath(im.module.name).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(ivy_vc_cache.opt_vc_cache_dir.get(),'isolates',
+                        os.path.basename(im.module.name) + '-' + name + '.json')
+
+def read_manifest():
+    global isolate_manifest
+    try:
+        with open(manifest_path()) as f:
+            isolate_manifest = json.load(f)
+    except (OSError,ValueError):
+        isolate_manifest = dict()
+
+def write_manifest():
+    manifest = dict(isolate_manifest)
+    manifest.update(passed_isolates)
+    path = manifest_path()
+    try:
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'w') as f:
+            json.dump(manifest,f,indent=1,sort_keys=True)
+    except OSError as e:
+        iu.warn(None,'cannot write isolate manifest {}: {}'.format(path,e))
+
+class WorkerError(iu.IvyError):
+    """ An error reported by an isolate checked in a worker process. The
+    message is already formatted by the worker. """
+    def __init__(self,text):
+        self.lineno = iu.nowhere()
+        self.msg = text
+    def __str__(self):
+        return self.msg
+
+def isolate_worker(isolate):
+    """ Checks one isolate in a forked worker process. Since the
+    worker is forked, it gets its own copy of the module and the z3
+    context. Output is captured so that the parent can print it in
+    isolate order. Returns a dictionary with the output, the number
+    of failures and the way the check terminated. """
+    global failures, some_bounded, checked_action_found, passed_isolates
+    failures = 0
+    passed_isolates = dict()
+    ivy_profile.records = []
+    ivy_vc_cache.reset_stats()
+    some_bounded = False
+    checked_action_found = False
+    res = {'error':None,'exit':None,'traceback':None}
+    old_stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        with ivy_profile.ProfileContext(isolate=isolate):
+            check_one_isolate(isolate)
+    except iu.IvyError as e:
+        res['error'] = str(e)
+    except SystemExit as e:
+        res['exit'] = e.code
+    except BaseException:
+        res['traceback'] = traceback.format_exc()
+    finally:
+        res['output'] = sys.stdout.getvalue()
+        sys.stdout = old_stdout
+    res['failures'] = failures
+    res['some_bounded'] = some_bounded
+    res['checked_action_found'] = checked_action_found
+    res['used_sorry'] = ivy_tactics.used_sorry
+    res['vc_cache'] = ivy_vc_cache.get_stats()
+    res['passed_isolates'] = passed_isolates
+    res['profile'] = ivy_profile.records
+    return res
+
+def check_isolates_parallel(isolates):
+    """ Checks the isolates using a pool of opt_jobs worker
+    processes. The results are reported in the original isolate
+    order, and checking stops at the first isolate that raises an
+    error or exits, as in the sequential case. """
+    global failures, some_bounded, checked_action_found
+    sys.stdout.flush() # so buffered output is not duplicated in workers
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(min(opt_jobs.get(),len(isolates)),maxtasksperchild=1) as pool:
+        for res in pool.imap(isolate_worker,isolates):
+            sys.stdout.write(res['output'])
+            sys.stdout.flush()
+            failures += res['failures']
+            if res['some_bounded']:
+                some_bounded = True
+            if res['checked_action_found']:
+                checked_action_found = True
+            if res['used_sorry']:
+                ivy_tactics.used_sorry = True
+            ivy_vc_cache.add_stats(res['vc_cache'])
+            passed_isolates.update(res['passed_isolates'])
+            ivy_profile.records.extend(res['profile'])
+            if res['traceback'] is not None:
+                sys.stderr.write(res['traceback'])
+                exit(1)
+            if res['exit'] is not None:
+                exit(res['exit'])
+            if res['error'] is not None:
+                raise WorkerError(res['error'])
+
 def check_module():
     # If user specifies an isolate, check it. Else, if any isolates
     # are specificied in the file, check all, else check globally.
@@ -841,43 +1187,18 @@ def check_module():
     if missing:
         raise iu.IvyError(None,"Some assertions are not checked")
 
-    for isolate in isolates:
-        if isolate is not None and isolate in im.module.isolates:
-            idef = im.module.isolates[isolate]
-            if len(idef.verified()) == 0 or isinstance(idef,ivy_ast.TrustedIsolateDef):
-                continue # skip if nothing to verify
-        if isolate:
-            print("\nIsolate {}:".format(isolate))
-        if isolate is not None and iu.compose_names(isolate,'macro_finder') in im.module.attributes:
-            save_macro_finder = islv.opt_macro_finder.get()
-            if save_macro_finder:
-                print("Turning off macro_finder")
-                islv.set_macro_finder(False)
-        with im.module.copy():
-            ivy_isolate.create_isolate(isolate) # ,ext='ext'
-            if opt_trusted.get():
-                continue
-            method_name = get_isolate_method(isolate)
-            if method_name == 'mc':
-                mc_isolate(isolate)
-            elif method_name == 'vmt':
-                mc_isolate(isolate,meth=ivy_vmt.check_isolate)
-            elif method_name.startswith('bmc['):
-                global some_bounded
-                some_bounded = True
-                _,prms = iu.parse_int_subscripts(method_name)
-                if len(prms) < 1 or len(prms) > 2:
-                    raise IvyError(None,'BMC method specifier should be bmc[<steps>] or bmc[<steps>][<unroll>]. Got "{}".'.format(method_name))
-                mc_isolate(isolate,lambda : ivy_bmc.check_isolate(prms[0],n_unroll = prms[1] if len(prms) >= 2 else None))
-            else:
-                logic = get_isolate_attr(isolate,'complete',None)
-                if logic is not None:
-                    im.module.logics = [logic]
-                check_isolate()
-        if isolate is not None and iu.compose_names(isolate,'macro_finder') in im.module.attributes:
-            if save_macro_finder:
-                print("Turning on macro_finder")
-                islv.set_macro_finder(True)
+    if opt_incremental_isolates.get():
+        read_manifest()
+    try:
+        if opt_jobs.get() > 1 and len(isolates) > 1 and not (diagnose.get() or opt_trace.get()):
+            check_isolates_parallel(isolates)
+        else:
+            for isolate in isolates:
+                with ivy_profile.ProfileContext(isolate=isolate):
+                    check_one_isolate(isolate)
+    finally:
+        if opt_incremental_isolates.get():
+            write_manifest()
     print('')
     if failures > 0:
         raise iu.IvyError(None,"failed checks: {}".format(failures))
@@ -904,7 +1225,12 @@ def main():
             if isinstance(act.checked_assert.get(),iu.LocationTuple) and act.checked_assert.get().filename == 'none.ivy' and act.checked_assert.get().line == 0:
                 print('NOT CHECKED')
                 exit(0);
-            check_module()
+            try:
+                check_module()
+            finally:
+                ivy_vc_cache.report()
+                ivy_profile.write()
+                islv.write_portfolio_winners()
     if some_bounded:
         print("BOUNDED")
     if ivy_tactics.used_sorry:
@@ -1019,7 +1019,8 @@ def resolve_alias(name):
     res = resolve_alias_int(name)
     return res
 
-defined_attributes = set(["weight","test","check","mc","bmc","method","separate","iterable","cardinality","radix","override","cppstd","libspec","macro_finder","global_parameter","complete"])
+defined_attributes = set(["weight","test","check","mc","bmc","method","separate","iterable","cardinality","radix","override","cppstd","libspec","macro_finder","global_parameter","complete",
+                          "pdr_timeout","bmc3_timeout","int_timeout","dprove_timeout","bmc3_frames"])
 
 class IvyDomainSetup(IvyDeclInterp):
     def __init__(self,domain):
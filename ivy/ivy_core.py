@@ -13,31 +13,45 @@ def biased_core(s,alits,unlikely):
     """ Try to produce a minimal unsatisfiable subset of alits, using as few
     of the alits in unlikely as possible. 
     """
-    core = alits
-    for lit in unlikely:
-        test = [c for c in core if get_id(c) != get_id(lit)]
-        if s.check(test) == unsat:
-            core = test
-    is_sat = s.check(core)
-    assert is_sat == unsat
-    core = minimize_core(s)
-    return core
+    unlikely_ids = set(get_id(c) for c in unlikely)
+    # First remove the unlikely literals that are not needed when all
+    # the others are present, then minimize. We don't start from the
+    # solver's core, since it may contain unlikely literals that could
+    # be avoided, and for the same reason the likely literals are kept
+    # out of the core refinement in the first step.
+    likely = [c for c in alits if get_id(c) not in unlikely_ids]
+    needed = minimize_core_aux2(s, [c for c in alits if get_id(c) in unlikely_ids], likely)
+    return minimize_core_aux2(s, needed + likely)
     
+def check_core(s,lits):
+    """ Checks lits, returning None if satisfiable, else the ids of
+    the literals in the unsat core """
+    if s.check(lits) == sat:
+        return None
+    return set(get_id(c) for c in s.unsat_core())
 
-def minimize_core_aux2(s, core):
+def minimize_core_aux2(s, core, fixed=[]):
+    """ Returns a minimal subset of core that is unsatisfiable together
+    with the literals in fixed, trying to remove literals in order
+    from the front. Instead of one literal at a time, we try to remove
+    a chunk of literals, doubling the chunk size when this succeeds and
+    halving it when it fails. A literal is kept when it cannot be
+    removed alone. The remaining literals are refined using the unsat
+    core of each successful removal. """
     mus = []
-    ids = {}
+    chunk = 1
     while core != []:
-        c = core[0]
-        new_core = mus + core[1:]
-        is_sat = s.check(new_core)
-        if is_sat == sat:
-            mus = mus + [c]
-            ids[get_id(c)] = True
-            core = core[1:]
+        chunk = min(chunk,len(core))
+        ids = check_core(s,mus + core[chunk:] + fixed)
+        if ids is None:
+            if chunk == 1:
+                mus.append(core[0])
+                core = core[1:]
+            else:
+                chunk //= 2
         else:
-            core = s.unsat_core()
-            core = [c for c in core if get_id(c) not in ids]
+            core = [c for c in core[chunk:] if get_id(c) in ids]
+            chunk *= 2
     return mus
 
 def minimize_core(s):
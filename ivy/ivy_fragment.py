@@ -438,15 +438,90 @@ def report_interp_over_var(fmla,lineno,node):
     report_feu_error('An interpreted symbol is applied to a universally quantified variable:\n'+
                      '{}{}'.format(lineno,var_uniq.undo(fmla))+var_msg)
 
+# The contribution of each assume or assert to the stratification
+# graph depends only on the formula, unless it uses macros, in which
+# case it depends on all the formulas using the macros. Since most
+# formulas are shared by many isolates, we compute the contribution of
+# formulas without macros once, and record it in fragment_cache. The
+# contribution is the list of pairs of nodes unified, the list of arcs
+# and the skolem map, where nodes are represented by their keys in
+# strat_map. The variables of these formulas are made unique by
+# fragment_uniq, so that the keys of different formulas are distinct.
+# If the formula violates FAU, we record the error instead.
+
+class FormulaFacts(object):
+    def __init__(self):
+        self.unified = []
+        self.arcs = []
+        self.skolems = dict()
+        self.error = None
+    def add(self):
+        """ Add the facts to the current stratification graph """
+        if self.error is not None:
+            raise self.error
+        for k1,k2 in self.unified:
+            unify(strat_map[k1],strat_map[k2])
+        arcs.extend((strat_map[a[0]],strat_map[a[1]]) + a[2:] for a in self.arcs)
+        skolem_map.update(self.skolems)
+
+fragment_cache = dict()
+fragment_uniq = il.VariableUniqifier()
+
+def formula_facts(role,pair,theory):
+    global var_uniq, skolem_map
+    key = (role,pair[0],str(pair[1].lineno),theory)
+    if key in fragment_cache:
+        return fragment_cache[key]
+    var_uniq = fragment_uniq
+    skolem_map = dict()
+    upair = (fragment_uniq(pair[0]),pair[1])
+    res = FormulaFacts()
+    try:
+        create_strat_map([upair] if role == 'assume' else [],[upair] if role == 'assert' else [],[])
+    except iu.IvyError as err:
+        res.error = err
+    keys = defaultdict(list)
+    for k,n in strat_map.items():
+        keys[find(n)].append(k)
+    rep = dict((n,ks[0]) for n,ks in keys.items())
+    res.unified = [(k,ks[0]) for ks in keys.values() for k in ks[1:]]
+    res.arcs = [(rep[find(a[0])],rep[find(a[1])]) + tuple(a[2:]) for a in arcs]
+    res.skolems = skolem_map
+    fragment_cache[key] = res
+    return res
+
 def check_feu(assumes,asserts,macros):
     """ Take a list of assumes, assert and macros, and determines
     whether collectively they are in the FEU fragment, raising an error
     exception if not. """
 
+    global var_uniq, skolem_map
+
+    # Get the cached facts for the formulas not using macros.
+
+    theory = frozenset((name,str(interp)) for name,interp in il.sig.interp.items())
+    macro_syms = set(df.defines() for df,lf in macros)
+    def cacheable(p):
+        try:
+            hash(p[0])
+        except TypeError:
+            return False
+        return not (macro_syms and any(sym in macro_syms for sym in ilu.used_symbols_ast(p[0])))
+    facts = []
+    def cached(role,pairs):
+        res = []
+        for p in pairs:
+            if cacheable(p):
+                facts.append(formula_facts(role,p,theory))
+            else:
+                res.append(p)
+        return res
+    assumes = cached('assume',assumes)
+    asserts = cached('assert',asserts)
+
     # Alpha convert so that all the variables have unique names,
 
-    global var_uniq
-    var_uniq = il.VariableUniqifier()
+    var_uniq = il.VariableUniqifier(used=fragment_uniq.rn.used)
     
     def vupair(p):
         return (var_uniq(p[0]),p[1])
@@ -455,9 +530,13 @@ def check_feu(assumes,asserts,macros):
     asserts = list(map(vupair,asserts))
     macros = list(map(vupair,macros))
 
-    # Create the stratificaiton graph, as described above.
+    # Create the stratificaiton graph, as described above, and add
+    # the cached facts.
 
+    skolem_map = dict()
     create_strat_map(assumes,asserts,macros)
+    for f in facts:
+        f.add()
     
     # Check for cycles in the stratification graph.
 
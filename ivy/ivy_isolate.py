@@ -16,6 +16,7 @@ from . import ivy_theory as ith
 from .ivy_ast import ASTContext
 from collections import defaultdict
 from . import ivy_printer
+import hashlib
 
 show_compiled = iu.BooleanParameter("show_compiled",False)
 cone_of_influence = iu.BooleanParameter("coi",True)
@@ -1467,6 +1468,51 @@ def get_mod_cone(mod,actions=None,roots=None,after_inits=[]):
         get_cone(actions,ai,cone)
     return cone
 
+# Get a fingerprint of the parts of the module that the verification
+# of an isolate can depend on. This is computed before the isolate is
+# created. It includes the actions in the cone of the actions present
+# in the isolate, with their mixins, and all of the global
+# declarations and formulas, so it is conservative. The string
+# "extra" can be used to add other dependencies, such as options.
+
+def isolate_fingerprint(mod,isolate,extra=''):
+    h = hashlib.sha256()
+    def add(*things):
+        for thing in things:
+            h.update(str(thing).encode('utf-8'))
+            h.update(b'\0')
+    add(extra,iu.get_string_version())
+    if isolate is not None and isolate in mod.isolates:
+        iso = mod.isolates[isolate]
+        add(isolate,repr(iso),type(iso).__name__)
+        roots = get_isolate_actions(mod,iso)
+    else:
+        add(isolate)
+        roots = list(mod.actions)
+    for actname in sorted(get_mod_cone(mod,roots=roots)):
+        action = mod.actions[actname]
+        add(actname,action,getattr(action,'formal_params',[]),getattr(action,'formal_returns',[]))
+        add(*mod.mixins.get(actname,[]))
+    add(*sorted(actname for actname in roots if actname in mod.public_actions))
+    for name in sorted(mod.attributes):
+        add(name,mod.attributes[name])
+    for sym in sorted(ivy_logic.all_symbols(),key=lambda s:s.name):
+        add(sym.name,sym.sort)
+    for name in sorted(ivy_logic.sig.interp):
+        add(name,ivy_logic.sig.interp[name])
+    for lfs in [mod.labeled_axioms,mod.labeled_props,mod.labeled_conjs,mod.labeled_inits,
+                mod.definitions,mod.natives]:
+        add(len(lfs),*lfs)
+    for name in sorted(mod.schemata):
+        add(name,mod.schemata[name])
+    for name,action in mod.initializers:
+        add(name,action)
+    for lf,proof in mod.proofs:
+        add(lf,proof)
+    for name in sorted(mod.isolate_proofs):
+        add(name,mod.isolate_proofs[name])
+    return h.hexdigest()
+
 def loop_action(action,mod):
     subst = dict((p,ivy_logic.Variable('Y'+p.name,p.sort)) for p in action.formal_params)
     action = lu.substitute_constants_ast(action,subst)
@@ -71,6 +71,13 @@ from .type_inference import concretize_sorts, concretize_terms, SortVar
 from collections import defaultdict
 from itertools import chain
 from . import ivy_smtlib
+from .utils import recstruct_object
+
+# With hash_cons=true, structurally equal terms are shared (see
+# utils/recstruct_object.py).
+
+opt_hash_cons = iu.BooleanParameter("hash_cons",False)
+opt_hash_cons.set_callback(recstruct_object.set_hash_consing)
 
 allow_unsorted = False
 repr = str
@@ -25,6 +25,7 @@ from itertools import chain
 from .ivy_logic_parser_gen import formula_parser,term_parser
 from collections import defaultdict
 from . import logic_util
+import weakref
 
 
 class LogicParseError(Exception):
@@ -47,10 +48,16 @@ class Clauses(object):
         
     @property
     def clauses(self):
-        res = tseitin_encode(self.to_open_formula())
+        # The CNF is cached. Since the lists fmlas and defs are sometimes
+        # modified in place, the cache records their contents.
+        key = (tuple(self.fmlas),tuple(self.defs))
+        cnf = getattr(self,'cnf_cache',None)
+        if cnf is None or not all(len(x) == len(y) and all(a is b for a,b in zip(x,y))
+                                  for x,y in zip(cnf[0],key)):
+            cnf = self.cnf_cache = (key,tseitin_encode(self.to_open_formula()))
 #        print "defs: {} fmlas: {} ".format(self.defs,self.fmlas)
-#        print "cnf: {}".format(res)
-        return res
+#        print "cnf: {}".format(cnf[1])
+        return [list(c) for c in cnf[1]]
     def triv_clauses(self):
         res = formula_to_clauses_aux(self.to_open_formula())
 #        print "defs: {} fmlas: {} ".format(self.defs,self.fmlas)
@@ -157,27 +164,71 @@ to_atom = to_formula
 
 # substitutions
 
+# Immutable compound terms. These may be shared between formulas.
+
+compound_term_types = tuple([lg.Apply,lg.Globally,lg.Eventually,lg.WhenOperator] + lg_ops)
+
+# Terms are DAGs, since subterms may be shared (for example, when
+# actual parameters are substituted in inlined calls). The
+# substitution functions below memoize on node identity within each
+# call, so each shared subterm is transformed once and the result is
+# shared. A compound term whose arguments are unchanged is returned
+# as is, so new nodes are allocated only along paths that change.
+# With an empty substitution, the root is still cloned (as it was
+# before memoization), since callers may own and modify the result.
+# The memo entries hold the original node, so that its id is not
+# reused during the call.
+
+def rebuild(ast,args,new_args):
+    if isinstance(ast,compound_term_types) and all(x is y for x,y in zip(args,new_args)):
+        return ast
+    return ast.clone(new_args)
+
 def substitute_ast(ast,subs):
     """
     Substitute terms for variables in an ast. Here, subs is
     a dict from string names of variables to terms.
     """
-    if isinstance(ast, Variable):
-        return subs.get(ast.rep,ast)
-    if is_quantifier(ast):
-        bounds = set(x.name for x in quantifier_vars(ast))
-        subs = dict((x,y) for x,y in subs.items() if x not in bounds)
-    return ast.clone(substitute_ast(x,subs) for x in ast.args)
+    if not subs:
+        return ast if isinstance(ast,Variable) else ast.clone(ast.args)
+    memo = dict()
+    scopes = [subs]  # keeps the subs objects used in memo keys alive
+    def rec(ast,subs):
+        if isinstance(ast, Variable):
+            return subs.get(ast.rep,ast)
+        key = (id(ast),id(subs))
+        if key in memo:
+            return memo[key][1]
+        inner = subs
+        if is_quantifier(ast):
+            bounds = set(x.name for x in quantifier_vars(ast))
+            if any(x in bounds for x in subs):
+                inner = dict((x,y) for x,y in subs.items() if x not in bounds)
+                scopes.append(inner)
+        args = ast.args
+        res = rebuild(ast,args,[rec(x,inner) for x in args])
+        memo[key] = (ast,res)
+        return res
+    return rec(ast,subs)
 
 def substitute_constants_ast(ast,subs):
     """
     Substitute terms for *constants*. Here, subs is
     a dict from string names of constants to terms.
     """
-    if is_constant(ast):
-        return subs.get(ast.rep,ast)
-    else:
-        return ast.clone(substitute_constants_ast(x,subs) for x in ast.args)
+    if not subs:
+        return ast if is_constant(ast) else ast.clone(ast.args)
+    memo = dict()
+    def rec(ast):
+        if is_constant(ast):
+            return subs.get(ast.rep,ast)
+        if id(ast) in memo:
+            return memo[id(ast)][1]
+        args = ast.args
+        res = rebuild(ast,args,[rec(x) for x in args])
+        memo[id(ast)] = (ast,res)
+        return res
+    return rec(ast)
 
 
 def rename_ast(ast,subs):
@@ -187,11 +238,25 @@ def rename_ast(ast,subs):
     are give the same sort as old names. Exception is thrown in case of
     a sort conflict.
     """
-    args = [rename_ast(x,subs) for x in ast.args]
-    if is_app(ast) and not is_named_binder(ast):
-        sym = subs.get(ast.rep,ast.rep)
-        return sym if is_constant(ast) else sym(*args)
-    return ast.clone(args)
+    memo = dict()
+    def rec(ast):
+        if id(ast) in memo:
+            return memo[id(ast)][1]
+        old_args = ast.args
+        args = [rec(x) for x in old_args]
+        if is_app(ast) and not is_named_binder(ast):
+            sym = subs.get(ast.rep,ast.rep)
+            if is_constant(ast):
+                res = sym
+            elif sym is ast.rep:
+                res = rebuild(ast,old_args,args)
+            else:
+                res = sym(*args)
+        else:
+            res = rebuild(ast,old_args,args)
+        memo[id(ast)] = (ast,res)
+        return res
+    return rec(ast)
 
 def normalize_free_variables(ast):
     """
@@ -425,11 +490,49 @@ def variables_ast(ast):
 variables_clause = variables_cube = used_variables_asts = apply_gen_to_list(variables_ast)
 variables_clauses = variables_cubes = apply_gen_to_clauses(variables_ast)
 
+# The sets of free variables and symbols of compound terms are
+# memoized as frozensets, so that queries on terms sharing subterms
+# do not re-walk the term. Hash-consed terms (see the hash_cons
+# option) are memoized in weak-keyed tables across calls, since they
+# hash and compare in constant time. Terms are immutable, so the
+# tables never need to be invalidated. Other terms are memoized by
+# id only for the duration of one call, since hashing them would walk
+# the whole term. Other ASTs (such as definitions and literals) are
+# not memoized.
+
+variables_memo = weakref.WeakKeyDictionary()
+
+def variables_set(ast,memo=None):
+    """ Returns the free variables of ast as a frozenset """
+    if not isinstance(ast,compound_term_types):
+        return frozenset(variables_ast(ast))
+    if ast._hash is not None:
+        table,key = variables_memo,ast
+    else:
+        memo = dict() if memo is None else memo
+        table,key = memo,id(ast)
+    res = table.get(key)
+    if res is None:
+        if is_binder(ast):
+            res = frozenset().union(*[variables_set(a,memo) for a in binder_args(ast)])
+            res = res.difference(binder_vars(ast))
+        else:
+            res = frozenset().union(*[variables_set(a,memo) for a in ast.args])
+        table[key] = res
+    return res
+
 # get set of variables occurring
 
-used_variables_ast = gen_to_set(variables_ast)
-used_variables_clause = gen_to_set(variables_clause)
-used_variables_clauses = gen_to_set(variables_clauses)
+def used_variables_ast(ast):
+    return set(variables_set(ast))
+
+def used_variables_clause(clause):
+    return set().union(*[variables_set(a) for a in clause])
+
+def used_variables_clauses(clauses):
+    if isinstance(clauses,Clauses):
+        return used_variables_clause(clauses.fmlas + clauses.defs)
+    return used_variables_ast(clauses)
 
 # generate variables in order of first occurrence
 
@@ -540,11 +643,40 @@ named_binders_asts = apply_gen_to_list(named_binders_ast)
 
 temporals_asts = apply_gen_to_list(temporals_ast)
 
+symbols_memo = weakref.WeakKeyDictionary()
+
+def symbols_set(ast,memo=None):
+    """ Returns the symbols of ast as a frozenset """
+    if not isinstance(ast,compound_term_types):
+        return frozenset(symbols_ast(ast))
+    if ast._hash is not None:
+        table,key = symbols_memo,ast
+    else:
+        memo = dict() if memo is None else memo
+        table,key = memo,id(ast)
+    res = table.get(key)
+    if res is None:
+        parts = [symbols_set(a,memo) for a in ast.args]
+        if is_app(ast):
+            parts.append(symbols_set(ast.rep.body,memo) if is_binder(ast.rep) else frozenset([ast.rep]))
+        res = frozenset().union(*parts)
+        table[key] = res
+    return res
+
 # get set of symbols occurring
 
-used_symbols_ast = gen_to_set(symbols_ast)
-used_symbols_asts = used_symbols_clause = gen_to_set(symbols_clause)
-used_symbols_clauses = gen_to_set(symbols_clauses)
+def used_symbols_ast(ast):
+    return set(symbols_set(ast))
+
+def used_symbols_clause(clause):
+    return set().union(*[symbols_set(a) for a in clause])
+
+used_symbols_asts = used_symbols_clause
+
+def used_symbols_clauses(clauses):
+    if isinstance(clauses,Clauses):
+        return used_symbols_clause(clauses.fmlas + clauses.defs)
+    return used_symbols_ast(clauses)
 
 # get set of symbols occurring
 
@@ -780,6 +912,7 @@ class TseitinContext(object):
         self.clauses = []
         self.used = used if used else {}
         self.fresh = UniqueRenamer('__ts',self.used)
+        self.defined = dict() # map from conjunction key to conjunction and its Tseitin literal
     def __enter__(self):
         global tseitin_context
         self.save = tseitin_context
@@ -800,6 +933,14 @@ def tseitin_encoding(f):
         raise ValueError()
     f = expand_abbrevs(f)
     if isinstance(f,And):
+        # A conjunction that occurs more than once shares a Tseitin
+        # symbol. Hash-consed conjunctions are keyed by themselves, so
+        # structurally equal ones share. Others are keyed by id, since
+        # hashing them walks the whole term, and the entry holds the
+        # conjunction so that its id is not reused.
+        key = f if f._hash is not None else id(f)
+        if key in tc.defined:
+            return tc.defined[key][1]
         args = [tseitin_encoding(g) for g in f.args]
 ##        print "args: %s" % args
         # TODO: this has to handle variables of different sorts and
@@ -812,6 +953,7 @@ def tseitin_encoding(f):
         res = Literal(1,Atom(fn,vs))
         tc.clauses += [[~res,arg] for arg in args]
         tc.clauses.append([res] + [~arg for arg in args])
+        tc.defined[key] = (f,res)
         return res
     if isinstance(f,Or):
         return ~tseitin_encoding(And(*[Not(x) for x in f.args]))
@@ -14,6 +14,7 @@ from . import ivy_theory as thy
 from . import ivy_ast
 from . import ivy_proof
 from . import ivy_trace
+from . import ivy_profile
 
 import tempfile
 import subprocess
@@ -21,6 +22,9 @@ from collections import defaultdict
 import itertools
 import sys
 import os
+import time
+import threading
+import queue
 
 logfile = None
 verbose = False
@@ -49,9 +53,11 @@ class Aiger(object):
         self.latches = latches
         self.outputs = outputs
         self.gates = []
+        self.strash = dict() # map from pairs of inputs to and gates
         self.map = dict()
         self.next_id = 1
         self.values = dict()
+        self.sim = None
         for x in inputs + latches:
             self.map[x] = self.next_id * 2
 #            print 'var: {} = {}'.format(x,self.next_id * 2)
@@ -75,10 +81,26 @@ class Aiger(object):
             return self.true()
         res = args[0]
         for x in args[1:]:
-            tmp = self.next_id * 2
-            self.gates.append((tmp,res,x))
-            self.next_id += 1
-            res = tmp
+            res = self.and2(res,x)
+        return res
+
+    # Structural hashing: an and gate is created only if it cannot be
+    # simplified and no gate with the same inputs exists.
+
+    def and2(self,x,y):
+        if x > y:
+            x,y = y,x
+        if x == 0 or x == self.notl(y):
+            return self.false()
+        if x == 1 or x == y:
+            return y
+        key = (x,y)
+        if key in self.strash:
+            return self.strash[key]
+        res = self.next_id * 2
+        self.gates.append((res,x,y))
+        self.next_id += 1
+        self.strash[key] = res
         return res
 
     def notl(self,arg):
@@ -157,7 +179,33 @@ class Aiger(object):
         for x,y,z in self.gates:
             strings.append(str('{} {} {}'.format(x,y,z)))
         return '\n'.join(strings)+'\n'
-                                          
+
+    def write_binary(self,f):
+        """ Write the circuit in binary AIGER format to binary file
+        f. The inputs and latches are numbered consecutively and each
+        gate is numbered after its inputs, as the format requires, so
+        the gates are written as deltas without renumbering. """
+        f.write('aig {} {} {} {} {}\n'.format(self.next_id - 1,len(self.inputs),
+                                              len(self.latches),len(self.outputs),
+                                              len(self.gates)).encode())
+        for x in self.latches:
+            f.write('{}\n'.format(self.values[x]).encode())
+        for x in self.outputs:
+            f.write('{}\n'.format(self.values[x]).encode())
+        buf = bytearray()
+        for x,y,z in self.gates:
+            if y < z:
+                y,z = z,y
+            for delta in (x - y, y - z):
+                while delta >= 0x80:
+                    buf.append((delta & 0x7f) | 0x80)
+                    delta >>= 7
+                buf.append(delta)
+            if len(buf) >= 1 << 16:
+                f.write(bytes(buf))
+                buf = bytearray()
+        f.write(bytes(buf))
+
     def sym_vals(self,syms):
         for sym in syms:
             assert sym in self.map, sym
@@ -175,10 +223,21 @@ class Aiger(object):
     def show_state(self):
         print('state: {}'.format(self.latch_vals()))
         
+    # Simulation. If numpy is available and the circuit has on average
+    # enough gates per level for vector operations to pay off, the
+    # gates are evaluated by AigerSim, else one at a time.
+
     def reset(self):
         self.state = dict((self.map[x],'0') for x in self.latches)
+        self.sim = None
+        if get_numpy() is not None and len(self.gates) >= 16 * len(self.levels()):
+            self.sim = AigerSim(self,1)
+            self.sim.reset()
+            self.bits = self.sim.bits()
 
     def getin(self,gi):
+        if self.sim is not None:
+            return '1' if self.bits[gi >> 1] ^ (gi & 1) else '0'
         if gi == 0:
             return '0'
         if gi == 1:
@@ -188,6 +247,11 @@ class Aiger(object):
 
     def step(self,inp):
         assert len(inp) == len(self.inputs)
+        if self.sim is not None:
+            np = get_numpy()
+            self.sim.step(np.array([[int(y)] for y in inp],dtype=np.uint64))
+            self.bits = self.sim.bits()
+            return
         for x,y in zip(self.inputs,inp):
             self.state[self.map[x]] = y
 #        print 'input: {}'.format(self.sym_vals(self.inputs))
@@ -198,11 +262,33 @@ class Aiger(object):
 #        print 'outputs: {}'.format(''.join(self.getin(self.values[x]) for x in self.outputs))
 
     def __next__(self):
-        for lt in self.latches:
-            self.state[self.map[lt]] = self.getin(self.values[lt])
+        if self.sim is not None:
+            self.sim.next()
+            self.bits = self.sim.bits()
+            return
+        post = [self.getin(self.values[lt]) for lt in self.latches]
+        for lt,val in zip(self.latches,post):
+            self.state[self.map[lt]] = val
 #        self.show_state()
 
 
+    def levels(self):
+        """ Returns the gates grouped by level, where the level of a
+        gate is one more than the greatest level of its inputs, and
+        inputs and latches have level 0. """
+        if getattr(self,'_levels',(None,-1))[1] != len(self.gates):
+            level = [0] * self.next_id
+            res = []
+            for gate in self.gates:
+                out,in0,in1 = gate
+                lvl = max(level[in0 >> 1],level[in1 >> 1])
+                level[out >> 1] = lvl + 1
+                if lvl == len(res):
+                    res.append([])
+                res[lvl].append(gate)
+            self._levels = (res,len(self.gates))
+        return self._levels[0]
+
     def debug(self):
         print('inputs: {}'.format([str(x) for x in self.inputs]))
         print('latches: {}'.format([str(x) for x in self.latches]))
@@ -218,6 +304,122 @@ class Aiger(object):
 
         
             
+def get_numpy():
+    """ Returns the numpy module, or None if it is not installed. """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+class AigerSim(object):
+    """ Bit-parallel simulator for an Aiger circuit. Each signal has
+    an array of words of 64 bits, and bit i of the words is the value
+    of the signal in the i-th simulation. The gates are evaluated level
+    by level, all the gates of a level at once. Requires numpy. """
+    def __init__(self,aiger,words):
+        np = self.np = get_numpy()
+        self.aiger = aiger
+        self.words = words
+        self.vals = np.zeros((aiger.next_id,words),dtype=np.uint64)
+        self.inputs = np.array([aiger.map[x] >> 1 for x in aiger.inputs],dtype=np.int64)
+        self.latches = np.array([aiger.map[x] >> 1 for x in aiger.latches],dtype=np.int64)
+        self.next_lits = self.lits([aiger.values[x] for x in aiger.latches])
+        self.levels = []
+        for gates in aiger.levels():
+            outs,in0,in1 = list(zip(*gates))
+            self.levels.append((np.array(outs,dtype=np.int64) >> 1,self.lits(in0),self.lits(in1)))
+    def lits(self,lits):
+        """ Returns the variables of a list of literals and their
+        negation masks. """
+        np = self.np
+        lits = np.array(lits,dtype=np.int64)
+        return lits >> 1,np.where(lits & 1,np.uint64(0xffffffffffffffff),np.uint64(0))[:,None]
+    def value(self,lit):
+        res = self.vals[lit >> 1]
+        return ~res if lit & 1 else res
+    def reset(self):
+        self.vals[self.latches] = 0
+    def bits(self):
+        """ Returns the values of the variables in the first simulation
+        as a list of 0 and 1. """
+        return (self.vals[:,0] & 1).tolist()
+    def step(self,inputs):
+        """ Evaluates the gates, given an array of words for each input """
+        vals = self.vals
+        vals[self.inputs] = inputs
+        for outs,(v0,m0),(v1,m1) in self.levels:
+            vals[outs] = (vals[v0] ^ m0) & (vals[v1] ^ m1)
+    def next(self):
+        """ Sets the latches to their next values """
+        v,m = self.next_lits
+        self.vals[self.latches] = self.vals[v] ^ m
+
+def random_simulation(aiger,steps,width,dead=None,seed=0):
+    """ Simulates aiger on width random input sequences, for the
+    given number of steps. If an output is true in some step, returns
+    the inputs of the sequence up to that step, as a list of strings,
+    else None.
+
+    If dead is a literal, a sequence in which it becomes true is
+    continued from the state of a random sequence in which it is
+    false. This is used for the latch recording that a constraint was
+    violated, since random inputs rarely satisfy the constraints for
+    many steps. """
+    np = get_numpy()
+    if np is None:
+        raise iu.IvyError(None,'random simulation requires the numpy package')
+    words = (width + 63) // 64
+    lanes = words * 64
+    shifts = np.arange(64,dtype=np.uint64)
+    sim = AigerSim(aiger,words)
+    sim.reset()
+    rng = np.random.default_rng(seed)
+    history = [] # list of pairs (inputs,parents)
+    parents = np.arange(lanes)
+    for k in range(steps):
+        inputs = np.frombuffer(rng.bytes(8*len(aiger.inputs)*words),dtype=np.uint64)
+        inputs = inputs.reshape((len(aiger.inputs),words))
+        history.append((inputs,parents))
+        sim.step(inputs)
+        fail = np.zeros(words,dtype=np.uint64)
+        for x in aiger.outputs:
+            fail |= sim.value(aiger.values[x])
+        if fail.any():
+            word = int(np.nonzero(fail)[0][0])
+            w = int(fail[word])
+            lane = word * 64 + (w & -w).bit_length() - 1
+            res = []
+            for inputs,parents in reversed(history):
+                word,bit = divmod(lane,64)
+                res.append(''.join(str((int(b) >> bit) & 1) for b in inputs[:,word]))
+                lane = int(parents[lane])
+            return list(reversed(res))
+        sim.next()
+        parents = np.arange(lanes)
+        if dead is not None:
+            alive = ((sim.value(dead)[:,None] >> shifts) & 1).reshape(lanes) == 0
+            if not alive.any():
+                return None
+            if not alive.all():
+                parents = np.where(alive,parents,rng.choice(np.nonzero(alive)[0],lanes))
+                bits = ((sim.vals[sim.latches][:,:,None] >> shifts) & 1).reshape((len(sim.latches),lanes))
+                bits = bits[:,parents].reshape((len(sim.latches),words,64))
+                sim.vals[sim.latches] = np.bitwise_or.reduce(bits << shifts,axis=2)
+    return None
+
+def write_witness(aiger,inputs,f):
+    """ Writes a witness for the sequence of inputs to file f, in the
+    format of ABC's write_aiger_cex. """
+    aiger.reset()
+    f.write('1\n')
+    for inp in inputs:
+        pre = aiger.latch_vals()
+        aiger.step(inp)
+        out = ''.join(aiger.getin(aiger.values[x]) for x in aiger.outputs)
+        next(aiger)
+        f.write('{} {} {} {}\n'.format(pre,inp,out,aiger.latch_vals()))
+
 # functions for binary encoding of finite sorts
 
 def ceillog2(n):
@@ -380,6 +582,9 @@ class Encoder(object):
     def __str__(self):
         return str(self.sub)
 
+    def write_binary(self,f):
+        self.sub.write_binary(f)
+
     def gebin(self,bits,n):
         if n == 0:
             return self.sub.true()
@@ -724,11 +929,38 @@ def instantiate_axioms(mod,stvars,trans,invariant,sort_constants,funs):
             return match(px,ey,mp) and match(py,ex,mp)
         return all(match(x,y,mp) for x,y in zip(pat.args,expr.args))
                                                                 
+    # Index the triggers by head symbol and arity, or for equalities,
+    # by the sort of the arguments. A trigger can only match terms with
+    # the same key.
+
+    def trigger_key(expr):
+        if il.is_app(expr):
+            return (expr.rep,len(expr.args))
+        if il.is_eq(expr):
+            return ('=',expr.args[0].sort)
+        return None
+
+    trigger_index = defaultdict(list)
+    for trig,ax in triggers:
+        trigger_index[trigger_key(trig)].append((trig,ax))
+
     # TODO: make sure matches are ground
+    # Shared subterms are visited once. Hash-consed terms are keyed by
+    # themselves, others by id, since hashing them walks the whole
+    # term (and definitions are not hashable). The map holds the terms,
+    # so that their ids are not reused.
+    visited = dict()
     def recur(expr):
+        vkey = expr if getattr(expr,'_hash',None) is not None else id(expr)
+        if vkey in visited:
+            return
+        visited[vkey] = expr
         for e in expr.args:
             recur(e)
-        for trig,ax in triggers:
+        key = trigger_key(expr)
+        if key is None:
+            return
+        for trig,ax in trigger_index.get(key,[]):
             mp = dict()
             if match(trig,expr,mp):
                 fmla = normalize(il.substitute(ax.formula,mp))
@@ -1671,17 +1903,118 @@ def aiger_witness_to_ivy_trace2(aiger,witnessfilename,action,stvarset,ext_act,an
 class ModelChecker(object):
     pass
 
+# The ABC engines that can be used, with their commands. An engine
+# may prove the property or find a counterexample, or it may give up
+# or time out, in which case the result of another engine is used.
+
+abc_engines = {
+    'pdr' : 'pdr',
+    'bmc3' : 'bmc3',
+    'int' : 'int',
+    'dprove' : 'dprove',
+}
+
+opt_mc_sim = iu.Parameter("mc_sim",0,process=int)
+opt_mc_sim_width = iu.Parameter("mc_sim_width",1024,process=int)
+
+opt_mc_engines = iu.Parameter("mc_engines",['pdr'],
+                              check=lambda s: all(e in abc_engines for e in s.split(',')),
+                              process=lambda s: s.split(','))
+
 class ABCModelChecker(ModelChecker):
+    def __init__(self,engine='pdr',timeout=None,frames=None):
+        self.engine,self.timeout,self.frames = engine,timeout,frames
     def cmd(self,aigfilename,outfilename):
         abc_path = os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),'bin'),'abc')
         if verbose:
             print("abc_path: {}".format(abc_path))
-        return [abc_path,'-c','read_aiger {}; pdr; write_aiger_cex  {}'.format(aigfilename,outfilename)]
+        engine_cmd = abc_engines[self.engine]
+        if self.frames is not None:
+            engine_cmd += ' -F {}'.format(self.frames)
+        return [abc_path,'-c','read_aiger {}; {}; write_aiger_cex  {}'.format(aigfilename,engine_cmd,outfilename)]
     def scrape(self,alltext):
-        return 'Property proved' in alltext
+        return 'Property proved' in alltext or 'Networks are equivalent' in alltext
+    def has_cex(self,outfilename):
+        try:
+            with open(outfilename,'r') as f:
+                return f.readline().strip() == '1'
+        except IOError:
+            return False
+
+def run_model_checkers(mcs,aigfilename):
+    """ Runs the model checkers mcs concurrently on aigfilename, and
+    returns a triple (mc,proved,outfilename) for the first one to give
+    a definitive answer, or None if none does. The others are killed.
+    An engine that fails gives no answer, and an error is raised only
+    if they all fail.
+    """
+    results = queue.Queue()
+    def reader(mc,p,outfilename):
+        texts = []
+        for line in p.stdout:
+            text = line.decode("utf-8")
+            if verbose and len(mcs) == 1:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            texts.append(text)
+        results.put((mc,p.wait(),''.join(texts),outfilename))
+    procs = []
+    for mc in mcs:
+        outfilename = aigfilename.replace('.aig','.{}.out'.format(mc.engine))
+        try:
+            p = subprocess.Popen(mc.cmd(aigfilename,outfilename),stdout=subprocess.PIPE)
+        except:
+            raise iu.IvyError(None,'failed to run model checker')
+        deadline = None if mc.timeout is None else time.time() + mc.timeout
+        procs.append((mc,p,deadline))
+        thread = threading.Thread(target=reader,args=(mc,p,outfilename))
+        thread.daemon = True
+        thread.start()
+    res = None
+    killed = set()
+    failed = set()
+    try:
+        for _ in procs:
+            while True:
+                deadlines = [d for mc,p,d in procs if d is not None and p.poll() is None]
+                wait = max(0,min(deadlines)-time.time()) if deadlines else None
+                try:
+                    mc,ret,alltext,outfilename = results.get(timeout=wait)
+                    break
+                except queue.Empty:
+                    for mc,p,d in procs:
+                        if d is not None and d <= time.time() and p.poll() is None:
+                            if verbose:
+                                print('{}: timed out'.format(mc.engine))
+                            killed.add(mc)
+                            p.kill()
+                            p.wait()
+            if verbose and len(mcs) > 1:
+                print('{}:'.format(mc.engine))
+                sys.stdout.write(alltext)
+            if ret != 0:
+                if mc not in killed:
+                    failed.add(mc)
+                    if verbose:
+                        print('{}: returned non-zero status {}'.format(mc.engine,ret))
+                continue
+            if mc.scrape(alltext):
+                res = (mc,True,outfilename)
+                break
+            if mc.has_cex(outfilename):
+                res = (mc,False,outfilename)
+                break
+    finally:
+        for mc,p,d in procs:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+    if res is None and len(failed) == len(mcs):
+        raise iu.IvyError(None,'model checker returned non-zero status')
+    return res
 
 
-def check_isolate(method="mc"):
+def check_isolate(method="mc",engines=None):
     
     if verbose:
         print()
@@ -1705,63 +2038,52 @@ def check_isolate(method="mc"):
     aiger,decoder,annot,cnsts,action,stvarset = to_aiger(mod,ext_act,method=method)
 #    print aiger
 
-    # output aiger to temp file
-
-    with tempfile.NamedTemporaryFile(mode='wt', suffix='.aag',delete=False) as f:
-        name = f.name
-#        print 'file name: {}'.format(name)
-        f.write(str(aiger))
-    
-    # convert aag to aig format
-
-    aigfilename = name.replace('.aag','.aig')
-    aigtoaig_path = os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),'bin'),'aigtoaig')
-    if verbose:
-        print("aigtoaig_path:{}".format(aigtoaig_path))
-    try:
-        ret = subprocess.call([aigtoaig_path,name,aigfilename])
-    except:
-        raise iu.IvyError(None,'failed to run aigtoaig')
-    if ret != 0:
-        raise iu.IvyError(None,'aigtoaig returned non-zero status')
+    # look for a counterexample by random simulation
+
+    if opt_mc_sim.get() > 0:
+        start_time = ivy_profile.timer()
+        cnst = aiger.encoding[il.Symbol('__cnst',il.find_sort('bool'))][0]
+        inputs = random_simulation(aiger.sub,opt_mc_sim.get(),opt_mc_sim_width.get(),
+                                   dead=aiger.sub.map[cnst])
+        if ivy_profile.enabled():
+            ivy_profile.record('mc_sim',ivy_profile.timer()-start_time,'none' if inputs is None else 'cex',
+                               lineno=ia.checked_assert.get() or None,gates=len(aiger.sub.gates))
+        if inputs is not None:
+            if verbose:
+                print('Random simulation found a counterexample of length {}'.format(len(inputs)))
+            with tempfile.NamedTemporaryFile(mode='wt', suffix='.out',delete=False) as f:
+                outfilename = f.name
+                write_witness(aiger.sub,inputs,f)
+            return aiger_witness_to_ivy_trace2(aiger,outfilename,action,stvarset,ext_act,annot,cnsts,decoder)
+
+    # output aiger to temp file in binary format. The circuit is not
+    # piped to ABC, since its read_aiger command needs a file (it
+    # reads the file size first), and a portfolio of engines can
+    # share the file.
+
+    with tempfile.NamedTemporaryFile(mode='wb', suffix='.aig',delete=False) as f:
+        aigfilename = f.name
+        aiger.write_binary(f)
         
-    # run model checker
-
-    outfilename = name.replace('.aag','.out')
-    mc = ABCModelChecker() # TODO: make a command-line option
-    cmd = mc.cmd(aigfilename,outfilename)
-#    print cmd
-    try:
-        p = subprocess.Popen(cmd,stdout=subprocess.PIPE)
-    except:
-        raise iu.IvyError(None,'failed to run model checker')
-
-    # pass through the stdout and collect it in texts
+    # run model checkers
 
+    if engines is None:
+        engines = [ABCModelChecker(e) for e in opt_mc_engines.get()]
+    start_time = ivy_profile.timer()
     if verbose:
         print('\nModel checker output:')
         print(80*'-')
-    texts = []
-    while True:
-        text = p.stdout.read(256)
-        if verbose:
-            sys.stdout.write(text.decode("utf-8"))
-        texts.append(text)
-        if len(text) < 256:
-            break
-    alltext = ''.join(x.decode("utf-8") for x in texts)
+    res = run_model_checkers(engines,aigfilename)
     if verbose:
         print(80*'-')
-    
-    # get the model checker status
-
-    ret = p.wait()
-    if ret != 0:
-        raise iu.IvyError(None,'model checker returned non-zero status')
-
-    # scrape the output to get the answer
-
-    if mc.scrape(alltext):
+    if res is None:
+        raise iu.IvyError(None,'model checker gave no result')
+    mc,proved,outfilename = res
+    if ivy_profile.enabled():
+        ivy_profile.record('mc',ivy_profile.timer()-start_time,'proved' if proved else 'cex',
+                           lineno=ia.checked_assert.get() or None,gates=len(aiger.gates),
+                           latches=len(aiger.latches),inputs=len(aiger.inputs),engine=mc.engine)
+    if proved:
         return None
     else:
         return aiger_witness_to_ivy_trace2(aiger,outfilename,action,stvarset,ext_act,annot,cnsts,decoder)        
@@ -0,0 +1,149 @@
+#
+# Copyright (c) Microsoft Corporation. All Rights Reserved.
+#
+""" Profiling of verification conditions.
+
+With the option profile=<file.json>, each solver check is recorded
+with the context in which it was made (isolate, action, checked
+assertion or conjecture), its wall time, the size of the
+verification condition and the z3 statistics. The records are
+written to the given file at the end of the run.
+
+When run as a command (ivy_profile), this module reads profile files
+from one or more runs and prints the checks ranked by time.
+"""
+
+from . import ivy_utils as iu
+from . import ivy_logic as il
+
+import json
+import sys
+import time
+
+opt_profile = iu.Parameter("profile","")
+
+records = []
+
+def enabled():
+    return bool(opt_profile.get())
+
+# The profiling context is a map from keys (such as "isolate" and
+# "action") to values, which is recorded with each check.
+
+context = dict()
+
+class ProfileContext(object):
+    """ Context Manager that adds keys to the profiling context. """
+    def __init__(self,**kwargs):
+        self.values = kwargs
+    def __enter__(self):
+        global context
+        self.old_context = context
+        context = dict(context)
+        context.update((key,str(value)) for key,value in self.values.items())
+        return self
+    def __exit__(self,exc_type, exc_val, exc_tb):
+        global context
+        context = self.old_context
+        return False # don't block any exceptions
+
+def count_quantifiers(fmla):
+    res = 1 if il.is_quantifier(fmla) else 0
+    return res + sum(count_quantifiers(a) for a in fmla.args)
+
+def clauses_size(clauses):
+    """ Returns the number of clauses and number of quantifiers in a
+    list of clause sets. """
+    nclauses = sum(len(c.fmlas) + len(c.defs) for c in clauses)
+    nquants = sum(count_quantifiers(f) for c in clauses for f in c.fmlas + c.defs)
+    return nclauses,nquants
+
+def z3_statistics(s):
+    stats = s.statistics()
+    return dict((key,stats.get_key_value(key)) for key in stats.keys())
+
+def record(kind,seconds,result=None,lineno=None,clauses=[],solver=None,**kwargs):
+    """ Records a check of the given kind. The clauses are the clause
+    sets making up the VC and solver is the z3 solver used, if any. """
+    rec = dict(context)
+    rec['kind'] = kind
+    rec['time'] = seconds
+    if result is not None:
+        rec['result'] = str(result)
+    if lineno is not None:
+        rec['lineno'] = str(lineno)
+    if clauses:
+        rec['clauses'],rec['quantifiers'] = clauses_size(clauses)
+    if solver is not None:
+        rec['z3'] = z3_statistics(solver)
+    rec.update(kwargs)
+    records.append(rec)
+
+def timer():
+    return time.perf_counter()
+
+def write():
+    if not enabled():
+        return
+    run = {'argv':sys.argv,'time':time.time(),'checks':records}
+    with open(opt_profile.get(),'w') as f:
+        json.dump(run,f,indent=1)
+
+# The ivy_profile command
+
+def usage():
+    print("usage: \n  {} [top=<n>] file.json ...".format(sys.argv[0]))
+    sys.exit(1)
+
+# A check is identified by its context and kind. The guarantee (for
+# checks of a sub-action call) and the depth (for BMC and k-induction)
+# distinguish checks made in the same action.
+
+def check_key(rec):
+    return (rec.get('isolate',''),rec.get('action',''),rec.get('guarantee',''),
+            rec.get('depth',''),rec.get('lineno',''),rec.get('kind',''))
+
+def main():
+    top = 20
+    args = sys.argv[1:]
+    while args and '=' in args[0]:
+        key,val = args[0].split('=',1)
+        if key != 'top':
+            usage()
+        top = int(val)
+        args = args[1:]
+    if not args:
+        usage()
+    total = dict()
+    worst = dict()
+    count = dict()
+    for fn in args:
+        try:
+            with open(fn) as f:
+                run = json.load(f)
+        except (OSError,ValueError) as e:
+            print('cannot read {}: {}'.format(fn,e))
+            sys.exit(1)
+        for rec in run['checks']:
+            key = check_key(rec)
+            total[key] = total.get(key,0.0) + rec['time']
+            count[key] = count.get(key,0) + 1
+            if key not in worst or worst[key]['time'] < rec['time']:
+                worst[key] = rec
+    print('{:>10} {:>10} {:>6} {:>10} {:>8}  {}'.format('total(s)','max(s)','count','clauses','quants','check'))
+    for key in sorted(total,key=lambda k:-total[k])[:top]:
+        isolate,action,guarantee,depth,lineno,kind = key
+        rec = worst[key]
+        desc = ' '.join(x for x in [kind,isolate,action,
+                                    'depth '+depth if depth else '',
+                                    'guarantee '+guarantee if guarantee else '',
+                                    lineno] if x)
+        print('{:>10.3f} {:>10.3f} {:>6} {:>10} {:>8}  {}'.format(
+            total[key],rec['time'],count[key],rec.get('clauses',''),rec.get('quantifiers',''),desc))
+        stats = rec.get('z3',{})
+        interesting = [(k,stats[k]) for k in ['conflicts','quant instantiations','max memory'] if k in stats]
+        if interesting:
+            print(' '*50 + ', '.join('{}: {}'.format(k,v) for k,v in interesting))
+
+if __name__ == "__main__":
+    main()
@@ -22,8 +22,14 @@ from . import ivy_utils as iu
 from . import ivy_unitres as ur
 from . import logic as lg
 from . import ivy_ast
+from . import ivy_vc_cache
+from . import ivy_profile
 
 import sys
+import os
+import json
+import hashlib
+import multiprocessing
 
 # Following accounts for Z3 API symbols that are hidden as of Z3-4.5.0
 
@@ -39,7 +45,11 @@ def set_seed(seed):
 opt_seed = iu.Parameter("seed",0,process=int)
 opt_seed.set_callback(set_seed)
 
+macro_finder_on = True
+
 def set_macro_finder(truth):
+    global macro_finder_on
+    macro_finder_on = truth
     z3.set_param('smt.macro_finder',truth)
     
 opt_incremental = iu.BooleanParameter("incremental",True)
@@ -1129,6 +1139,63 @@ def size_constraint(x, size):
         return lg.And()
 
 
+class SizeSearch(object):
+    """ Minimizes the sizes of sorts and relations in the model of a
+    satisfiable solver s, in order. For each one, the least
+    satisfiable size bound is found by galloping (trying bounds 1, 2,
+    4, ...) and then binary search, starting from the size in the
+    current model if known. The bounds are guarded by literals passed
+    as assumptions, so no scopes are pushed. When finish is called, s
+    has a model satisfying all the bounds found. """
+    def __init__(self,s):
+        self.s = s
+        self.model = s.model() # a model satisfying the bounds found so far
+        self.fixed = [] # literals of the bounds found so far
+        self.last = None # literal of the last satisfiable check
+        self.valid = True # the solver's model satisfies fixed
+    def bound_literal(self,x,n):
+        lit = z3.Bool('__size${}${}'.format(x,n))
+        self.s.add(z3.Implies(lit,formula_to_z3(size_constraint(x, n))))
+        return lit
+    def check(self,lit):
+        self.last = lit if decide(self.s,self.fixed+[lit]) == z3.sat else None
+        if self.last is not None:
+            self.model = self.s.model()
+        return self.last is not None
+    def model_size(self,x):
+        if type(x) is lg.UninterpretedSort:
+            for z3sort in self.model.sorts():
+                if sort_from_z3(z3sort) == x:
+                    return len(self.model.get_universe(z3sort))
+        return None
+    def minimize(self,x):
+        lits = dict()
+        def literal(n):
+            if n not in lits:
+                lits[n] = self.bound_literal(x,n)
+            return lits[n]
+        lo,hi = 0,self.model_size(x) # bounds <= lo are unsat, hi is sat
+        self.last = None
+        n = 1
+        while hi is None or n < hi:
+            if self.check(literal(n)):
+                hi = n
+                break
+            lo,n = n,2*n
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.check(literal(mid)):
+                hi = mid
+            else:
+                lo = mid
+        self.fixed.append(literal(hi))
+        self.valid = self.last is lits[hi]
+    def finish(self):
+        if not self.valid:
+            res = decide(self.s,self.fixed)
+            assert res == z3.sat
+            self.valid = True
+
 def model_if_none(clauses1,implied,model):
     h = model
     if h == None:
@@ -1158,18 +1225,265 @@ def model_if_none(clauses1,implied,model):
     return h
 
 
+# Portfolio solving. With portfolio=K, each query is solved by K
+# processes in parallel, each with a different solver configuration,
+# and the first definitive answer is used. Each configuration is a map
+# from z3 parameter names to values. The winning configuration is
+# recorded in the VC cache directory, keyed by a hash of the query, so
+# the next time the query is solved with this configuration alone. The
+# hash combines the z3 hashes of the solver's assertions and of the
+# assumption literals, which are cheap to get and stable across runs.
+# The winners are written once, at the end of the run. If the answer
+# is sat, the parent solves the query again with the winning
+# configuration to get the model. In the parent, the configuration is
+# set on the query's solver, since global parameters only affect new
+# solvers.
+
+opt_portfolio = iu.Parameter("portfolio",0,process=int)
+
+def portfolio_defaults():
+    return {'smt.random_seed':opt_seed.get(),'smt.macro_finder':macro_finder_on,
+            'smt.mbqi':True,'smt.relevancy':2}
+
+def portfolio_configs(k):
+    seed = opt_seed.get()
+    res = [{},
+           {'smt.random_seed':seed+1},
+           {'smt.macro_finder':not macro_finder_on},
+           {'smt.mbqi':False},
+           {'smt.random_seed':seed+2,'smt.relevancy':0}]
+    res.extend({'smt.random_seed':seed+i} for i in range(3,k-len(res)+3))
+    return res[:k]
+
+class SolverConfig(object):
+    """ Context Manager that temporarily applies a solver
+    configuration. If a solver is given, the configuration is set on
+    this solver, else in the global z3 parameters, which only affect
+    solvers created afterward. """
+    def __init__(self,config,solver=None):
+        self.config = config
+        self.solver = solver
+    def set(self,name,value):
+        if self.solver is not None:
+            self.solver.set(name,value)
+        else:
+            z3.set_param(name,value)
+    def __enter__(self):
+        for name,value in self.config.items():
+            self.set(name,value)
+        return self
+    def __exit__(self,exc_type, exc_val, exc_tb):
+        defaults = portfolio_defaults()
+        for name in self.config:
+            self.set(name,defaults[name])
+        return False # don't block any exceptions
+
+portfolio_winners = None
+portfolio_winners_changed = False
+
+def portfolio_winners_path():
+    return os.path.join(ivy_vc_cache.opt_vc_cache_dir.get(),'portfolio.json')
+
+def get_portfolio_winners():
+    global portfolio_winners
+    if portfolio_winners is None:
+        try:
+            with open(portfolio_winners_path()) as f:
+                portfolio_winners = json.load(f)
+        except (OSError,ValueError):
+            portfolio_winners = dict()
+    return portfolio_winners
+
+def record_portfolio_winner(key,config):
+    global portfolio_winners_changed
+    get_portfolio_winners()[key] = config
+    portfolio_winners_changed = True
+
+def write_portfolio_winners():
+    """ Writes the winners recorded in this run, if any. """
+    global portfolio_winners_changed
+    if not portfolio_winners_changed:
+        return
+    path = portfolio_winners_path()
+    try:
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'w') as f:
+            json.dump(portfolio_winners,f,sort_keys=True)
+        portfolio_winners_changed = False
+    except OSError as e:
+        iu.warn(None,'cannot write portfolio record {}: {}'.format(path,e))
+
+def portfolio_key(s,atoms):
+    hashes = [str(a.hash()) for a in s.assertions()]
+    if atoms is not None:
+        hashes.append('assuming')
+        hashes.extend(str(a.hash()) for a in atoms)
+    return hashlib.sha256(' '.join(hashes).encode('utf-8')).hexdigest()
+
+def portfolio_worker(s,atoms,config,queue,idx):
+    res = z3.unknown
+    try:
+        with SolverConfig(config):
+            s2 = z3.Solver()
+            s2.add(s.assertions())
+            res = s2.check() if atoms == None else s2.check(atoms)
+    finally:
+        queue.put((idx,str(res)))
+
+def portfolio_check(s,atoms):
+    key = portfolio_key(s,atoms)
+    winners = get_portfolio_winners()
+    if key in winners:
+        with SolverConfig(winners[key],s):
+            res = s.check() if atoms == None else s.check(atoms)
+        if res != z3.unknown:
+            return res
+    configs = portfolio_configs(opt_portfolio.get())
+    sys.stdout.flush() # so buffered output is not duplicated in workers
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.SimpleQueue()
+    procs = [ctx.Process(target=portfolio_worker,args=(s,atoms,config,queue,idx))
+             for idx,config in enumerate(configs)]
+    for p in procs:
+        p.start()
+    winner,answer = None,'unknown'
+    try:
+        for _ in procs:
+            idx,res = queue.get()
+            if res != 'unknown':
+                winner,answer = idx,res
+                break
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.join()
+    if winner is None:
+        return z3.unknown
+    record_portfolio_winner(key,configs[winner])
+    if answer == 'unsat':
+        return z3.unsat
+    with SolverConfig(configs[winner],s):
+        return s.check() if atoms == None else s.check(atoms)
+
+def use_portfolio():
+    return opt_portfolio.get() > 1 and not multiprocessing.current_process().daemon
+
 def decide(s,atoms=None):
     # print ("solving{")
     # f = open("ivy.smt2","w")
     # f.write(s.to_smt2())
     # f.close()
-    res = s.check() if atoms == None else s.check(atoms)
+    if use_portfolio():
+        res = portfolio_check(s,atoms)
+    else:
+        res = s.check() if atoms == None else s.check(atoms)
     if res == z3.unknown:
         print(s.to_smt2())
         raise iu.IvyError(None,"Solver produced inconclusive result")
     # print ("}")
     return res
 
+def base_solver(clauses,assumes=[]):
+    """ Returns a solver asserting clauses and the list of clauses assumes """
+    s = z3.Solver()
+    the_fmla = clauses_to_z3(clauses)
+#    iu.dbg('the_fmla')
+    s.add(the_fmla)
+    for fmla in assumes:
+        s.add(clauses_to_z3(fmla))
+    return s
+
+# With shared_theory=true, the background theory of the isolate being
+# checked is translated and asserted once in a shared solver. A check
+# whose clauses include the background theory is done in a scope
+# pushed on this solver, containing only the remaining clauses. The
+# scopes are popped when the check is done. The shared solver is kept
+# for the current isolate (that is, the current module object, since
+# each isolate is checked in a copy of the module) and rebuilt if the
+# theory changes. Theory formulas are matched by content, since the
+# clauses of a check often contain copies of them.
+
+opt_shared_theory = iu.BooleanParameter("shared_theory",False)
+
+shared_theory = None # tuple of module, theory, its content keys and solver
+shared_theory_builds = 0 # number of times the theory is translated
+shared_theory_uses = 0 # number of checks using the shared solver
+
+def current_background_theory():
+    from . import ivy_module
+    return ivy_module.module.background_theory()
+
+def content_key(fmla):
+    """ Returns a key identifying fmla by its content. Definitions are
+    not hashable, so they are keyed by their arguments. """
+    return tuple(fmla.args) if isinstance(fmla,ivy_logic.Definition) else fmla
+
+def theory_keys(theory):
+    """ Returns the content keys of the formulas and definitions of
+    theory, reusing those of the shared solver if possible. """
+    from . import ivy_module
+    if (shared_theory is not None and shared_theory[0] is ivy_module.module
+        and shared_theory[1] is theory):
+        return shared_theory[2]
+    return frozenset(content_key(f) for f in theory.fmlas + theory.defs)
+
+def theory_solver(theory,keys):
+    """ Returns the shared solver asserting theory, whose content keys
+    are keys. """
+    global shared_theory, shared_theory_builds
+    from . import ivy_module
+    mod = ivy_module.module
+    if shared_theory is None or shared_theory[0] is not mod or shared_theory[2] != keys:
+        shared_theory = (mod,theory,keys,base_solver(theory))
+        shared_theory_builds += 1
+    return shared_theory[3]
+
+def split_theory(clauses,keys):
+    """ If clauses contains formulas and definitions with all of the
+    content keys, returns the remaining clauses, else None. """
+    fkeys = [content_key(f) for f in clauses.fmlas]
+    dkeys = [content_key(d) for d in clauses.defs]
+    if not keys.issubset(fkeys + dkeys):
+        return None
+    return Clauses([f for f,k in zip(clauses.fmlas,fkeys) if k not in keys],
+                   [d for d,k in zip(clauses.defs,dkeys) if k not in keys])
+
+def vc_solver(clauses,assumes,scopes):
+    """ Returns a solver for clauses and the list of clauses assumes,
+    using the shared theory solver if possible. In this case, the
+    solver and its scope level are added to the list scopes. """
+    global shared_theory_uses
+    if opt_shared_theory.get() and opt_incremental.get():
+        theory = current_background_theory()
+        keys = theory_keys(theory)
+        rest = split_theory(clauses,keys) if keys else None
+        if rest is not None:
+            shared_theory_uses += 1
+            s = theory_solver(theory,keys)
+            scopes.append((s,s.num_scopes()))
+            s.push()
+            s.add(clauses_to_z3(rest))
+            for fmla in assumes:
+                s.add(clauses_to_z3(fmla))
+            return s
+    return base_solver(clauses,assumes)
+
+def solver_params():
+    """ Returns the solver settings that can affect the result of a check """
+    return {'seed':opt_seed.get(),'macro_finder':macro_finder_on,
+            'native_enums':use_z3_enums,'z3':z3.get_version_string()}
+
+def profile_lineno(fc):
+    lf = getattr(fc,'lf',None)
+    return getattr(lf,'lineno',None)
+
+def vc_site(fc):
+    """ Text identifying the check of fc in the VC cache, from the
+    profiling context and the location of the assertion. """
+    return repr(sorted(ivy_profile.context.items())) + str(profile_lineno(fc))
+
 def get_small_model(clauses, sorts_to_minimize, relations_to_minimize, final_cond=None, shrink=True):
     """
     Return a HerbrandModel with a "small" model of clauses.
@@ -1206,10 +1520,24 @@ def get_small_model(clauses, sorts_to_minimize, relations_to_minimize, final_con
             print(fmla)
             print()
 
-    s = z3.Solver()
-    the_fmla = clauses_to_z3(clauses)
-#    iu.dbg('the_fmla')
-    s.add(the_fmla)
+    scopes = []
+    try:
+        return small_model_int(clauses,sorts_to_minimize,relations_to_minimize,final_cond,shrink,scopes)
+    finally:
+        for s,level in scopes:
+            s.pop(s.num_scopes()-level)
+
+def small_model_int(clauses, sorts_to_minimize, relations_to_minimize, final_cond, shrink, scopes):
+
+    # With the VC cache, the solver is created only when needed, so
+    # that no translation is done if all checks are cache hits.
+    fp = None
+    if ivy_vc_cache.enabled() and isinstance(final_cond,list):
+        fp = ivy_vc_cache.Fingerprint(solver_params())
+        fp.add(clauses)
+        s = None
+    else:
+        s = vc_solver(clauses,[],scopes)
     
     # res = decide(s)
     # if res == z3.unsat:
@@ -1221,61 +1549,75 @@ def get_small_model(clauses, sorts_to_minimize, relations_to_minimize, final_con
             res = z3.unsat
             for fc in final_cond:
                 if not opt_incremental.get():
-                    s = z3.Solver()
-                    s.add(clauses_to_z3(clauses))
-                    for fmla in assumes:
-                        s.add(clauses_to_z3(fmla))
+                    s = None
                 fc.start()
                 if fc.assume():
                     if opt_show_vcs.get():
                         print('\nassume: {}'.format(fc.cond()))
                         sys.stdout.flush()
-                    s.add(clauses_to_z3(fc.cond()))
+                    if s is not None:
+                        s.add(clauses_to_z3(fc.cond()))
                     assumes.append(fc.cond())
+                    if fp is not None:
+                        fp.add(fc.cond())
                 else:
                     sys.stdout.flush()
-                    if opt_incremental.get():
-                        s.push()
-                    sys.stdout.flush()
                     foo = fc.cond()
-                    sys.stdout.flush()
                     if opt_show_vcs.get():
                         print('\nassert: {}'.format(foo))
                         sys.stdout.flush()
+                    vc_fp = fp.extend(foo) if fp is not None else None
+                    site = vc_site(fc) if fp is not None else None
+                    if vc_fp is not None and ivy_vc_cache.lookup(vc_fp,site):
+                        if ivy_profile.enabled():
+                            ivy_profile.record('vc',0.0,'cached',lineno=profile_lineno(fc))
+                        fc.unsat()
+                        continue
+                    if s is None:
+                        s = vc_solver(clauses,assumes,scopes)
+                    start_time = ivy_profile.timer()
+                    if opt_incremental.get():
+                        s.push()
                     the_fmla = clauses_to_z3(foo)
                     # iu.dbg('the_fmla')
                     s.add(the_fmla)
                     res = decide(s)
+                    if ivy_profile.enabled():
+                        ivy_profile.record('vc',ivy_profile.timer()-start_time,res,lineno=profile_lineno(fc),
+                                           clauses=[clauses]+assumes+[foo],solver=s)
                     if res != z3.unsat:
                         if fc.sat():
                             res = z3.unsat
                         else:
                             break
                     else:
+                        if vc_fp is not None:
+                            ivy_vc_cache.store(vc_fp,site)
                         fc.unsat()
                     if opt_incremental.get():
                         s.pop()
         else:
+            start_time = ivy_profile.timer()
             s.add(clauses_to_z3(final_cond))
             res = decide(s)
+            if ivy_profile.enabled():
+                ivy_profile.record('vc',ivy_profile.timer()-start_time,res,
+                                   clauses=[clauses,final_cond],solver=s)
     else:
+        start_time = ivy_profile.timer()
         res = decide(s)
+        if ivy_profile.enabled():
+            ivy_profile.record('vc',ivy_profile.timer()-start_time,res,clauses=[clauses],solver=s)
     if res == z3.unsat:
         return None
 
     if shrink:
         print("searching for a small model...", end=' ')
         sys.stdout.flush()
+        search = SizeSearch(s)
         for x in chain(sorts_to_minimize, relations_to_minimize):
-            for n in itertools.count(1):
-                s.push()
-                sc = size_constraint(x, n)
-                s.add(formula_to_z3(sc))
-                res = decide(s)
-                if res == z3.sat:
-                    break
-                else:
-                    s.pop()
+            search.minimize(x)
+        search.finish()
         print("done")
     m = get_model(s)
     # print ("model = {}".format(m))
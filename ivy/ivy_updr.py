@@ -1,155 +1,193 @@
-#! /usr/bin/env python
 #
 # Copyright (c) Microsoft Corporation. All Rights Reserved.
 #
-import sys
-import pickle
-import string
-from .ivy_utils import set_parameters, gen_to_set
-from . import ivy_logic_utils as lu
-from . import ivy_logic
-from . import ivy
+""" Automatic invariant inference by property directed reachability
+(PDR, also known as IC3), for isolates with attribute method=pdr.
+
+The transition relation is the update of the environment action, as in
+BMC. Frame 0 is the initial condition, and each frame i > 0 is the set
+of lemmas holding in all states reachable in at most i steps, which
+are universally quantified clauses. A lemma is stored with the highest
+frame in which it is known to hold. Bad states (violating the
+invariants or failing an assertion) are represented by diagrams of
+their models, which are existentially quantified conjunctions of
+literals, as in universal PDR [Karbyshev et al., 2015]. A diagram that
+cannot be reached from frame i-1 is blocked by a lemma obtained from
+an unsat core of the diagram. When two successive frames are equal,
+they are an inductive invariant.
+
+If a diagram is reachable from the initial states, the counterexample
+may be spurious, because of the abstraction. In this case, BMC is used
+to find a concrete counterexample.
+"""
+
+from . import ivy_module as im
+from . import ivy_actions as ia
+from . import ivy_logic as il
 from . import ivy_transrel as tr
-from itertools import chain
-from . import ivy_solver as sv
-import z3
-import mini_pdr as pd
+from . import ivy_logic_utils as ilu
 from . import ivy_utils as iu
-
-from pattern.debug.profile import Stopwatch
-
-def num_clauses(formula):
-    if z3.is_and(formula):
-        return len(formula.children())
-    elif formula == True or z3.is_true(formula) or \
-         formula == False or z3.is_false(formula):
-        return 0
-    else:
-        return 1
-
-def num_univ_clauses(formula):
-    if z3.is_and(formula):
-        fs = formula.children()
-        n = 0
-        for f in fs:
-            if z3.is_quantifier(f) and f.is_forall():
-                n += 1
-        return n
-    elif z3.is_quantifier(formula) and formula.is_forall():
-        return 1
-    else:
-        return 0
-
-def forward_clauses(clauses,inflex):
-    return lu.rename_clauses(clauses, dict((x,tr.new(x)) for x in lu.used_symbols_clauses(clauses)
-        if x != '=' and x not in inflex))
-
-if __name__ == "__main__":
-    ag = ivy.ivy_init()
-    state = ag.states[0]
-    sig = ag.domain.sig
-    ptc = lu.TseitinContext()
-
-    actions = [ag.actions[lab] for lab in ag.actions if lab != "error"]
-
-    # get error states by computing reverse image or error action
-
-    err_act = ag.actions["error"].update(ag.domain,state.in_scope)
-    axioms = state.domain.background_theory(state.in_scope)
-    error = tr.reverse_image([],axioms,err_act)
-    print("error = {}".format(error))
-
-    # get actions as updates
-    updates = [action.update(ag.domain,state.in_scope) for action in actions]
-
-    # get all the flexible (updated) variables
-    flex = set(sym for u in updates for sym in u[0])
-    print("flex = {}".format(flex))
-
-    # inflex is all non-skolem symbols in signature that are not updated
-    all_syms = sig.symbols
-    inflex = set(sym for sym in all_syms if sym not in flex and not tr.is_new(sym) and not tr.is_skolem(sym))
-    print("inflex = {}".format(inflex))
-
-    # get all the skolem symbols
-    all_syms = sig.symbols
-    skolems = set(sym for sym in all_syms if tr.is_skolem(sym))
-    print("skolems = {}".format(skolems))
-
-    # make frames explicit
-    updates = [tr.frame_update(u,flex,sig) for u in updates]
-    for u in updates:
-        print(u)
-
-    # locals are flexible and skolem symbols (next values unused for skolems)
-    ns = sv.native_symbol
-    #lsyms = [(ns(sym),ns(tr.new(sym))) for sym in chain(flex,skolems)]
-    lsyms = [(ns(sym),ns(tr.new(sym))) for sym in chain(flex)]
-
-    # globals are the inflexible symbols
-    gsyms = [ns(sym) for sym in inflex]
-    
-    print("lsyms = {}".format(lsyms))
-    print("gsyms = {}".format(gsyms))
-
-    init = state.clauses
-    init = forward_clauses(init,inflex)
-    print("init = {}".format(init))
-
-    error = forward_clauses(error,inflex)
-    print("error = {}".format(error))
-
-    axioms += forward_clauses(axioms,inflex)
-
-    init_z3 = sv.clauses_to_z3(init)
-    print("init_z3 = {}".format(init_z3))
-    for a in updates:
-        print(lu.simplify_clauses(a[1]))
-    rho_z3 = z3.Or(*[sv.clauses_to_z3(lu.simplify_clauses(a[1])) for a in updates])
-    print("rho_z3 = {}".format(rho_z3))
-    bad_z3 = sv.clauses_to_z3(error)
-    print("bad_z3 = {}".format(bad_z3))
-    background_z3 = sv.clauses_to_z3(axioms)
-    print("background_z3 = {}".format(background_z3))
-    #relations_z3 = [ns(rel) for rel in sig.relations if tr.is_new(rel) or rel in inflex]
-    relations_z3 =  [ x for x in gsyms if not z3.is_const(x) or (z3.is_const(x) and x.sort() == z3.BoolSort()) ]
-    relations_z3 += [ x for _,x in lsyms if not z3.is_const(x) or (z3.is_const(x) and x.sort() == z3.BoolSort()) ]
-    print("relations_z3 = {}".format(relations_z3))
-
-    ### HACK: remove skolem predicates from the list of predicate symbols
-    #relations_z3 = [ x for x in relations_z3 if not x in skolems ]
-
-    pdr = pd.PDR(init_z3, rho_z3, bad_z3, background_z3, gsyms, lsyms, relations_z3, True)
-
-    watch = Stopwatch()
-
-    with watch:
-        outcome = pdr.run()
-    if outcome:
-        status = "valid"
-        if hasattr(pdr, 'verify') and not pdr.verify(outcome):
-            print("incorrect!!")
-            status = "incorrect"
-    else:
-        print("NOT VALID")
-        #status = report_failure(pdr, z3g, vocab)
-
-    if outcome:
-        print("(%d clauses)" % num_clauses(outcome))
-        print("(%d universal clauses)" % num_univ_clauses(outcome))
-        #fol_outcome = z3g.formula_back(outcome)
-        #fol_invariant = FolSubstitution(extra.defs)( fol_outcome )
-        #print fol_invariant
-
-    print("PDR: %.2fs" % watch.clock.elapsed)
-    print("N =", pdr.N)
-    print(pdr.iteration_count, "iterations")
-    print(pdr.sat_query_count, "calls to SAT")
-            
-
-#    syms = set(s for (upd,tr,pre) in updates for s in lu.symbols_clauses(tr))
-#    print syms
-
-        
-
-
+from . import ivy_solver as slv
+from . import ivy_profile
+from . import ivy_bmc
+import ivy.z3 as z3
+
+import heapq
+
+def rename_skolems(clauses,prefix):
+    """ Renames the local skolems in clauses using prefix, so they are
+    distinct from skolems in other clauses """
+    rn = dict((sym,sym.prefix(prefix)) for sym in ilu.used_symbols_clauses(clauses)
+              if tr.is_skolem(sym) and not tr.is_global_skolem(sym))
+    return ilu.rename_clauses(clauses,rn)
+
+class PDR(object):
+    def __init__(self,init,update,axioms,bad):
+        updated,trans,fail = update
+        self.updated = updated
+        self.post = dict((x,tr.new(x)) for x in updated)
+        self.axioms = axioms
+        self.init = ilu.and_clauses(init,axioms)
+        post_axioms = ilu.rename_clauses(ilu.clauses_using_symbols(updated,axioms),self.post)
+        self.trans = ilu.and_clauses(rename_skolems(trans,'__pdr_'),post_axioms)
+        self.bad = [bad,rename_skolems(fail,'__pdr_')]
+        self.lemmas = [] # list of pairs (lemma,frame)
+        self.n_frames = 1
+        self.counter = 0 # for ordering proof obligations
+    def frame(self,i):
+        """ Returns the clauses characterizing frame i """
+        if i == 0:
+            return self.init
+        return ilu.and_clauses(ilu.Clauses([l for l,j in self.lemmas if j >= i]),self.axioms)
+    def model(self,clauses):
+        """ Returns a small model of clauses, or None """
+        s = slv.base_solver(clauses)
+        start_time = ivy_profile.timer()
+        res = slv.decide(s)
+        if ivy_profile.enabled():
+            ivy_profile.record('pdr',ivy_profile.timer()-start_time,res,clauses=[clauses],solver=s)
+        if res == z3.unsat:
+            return None
+        search = slv.SizeSearch(s)
+        for sort in il.uninterpreted_sorts():
+            search.minimize(sort)
+        search.finish()
+        return slv.HerbrandModel(s,slv.get_model(s),ilu.used_symbols_clauses(clauses))
+    def is_state_symbol(self,sym):
+        return not (tr.is_new(sym) or tr.is_skolem(sym) or sym.name.startswith('@')
+                    or il.is_interpreted_symbol(sym))
+    def diagram(self,clauses,h):
+        """ Returns the diagram of the state in model h of clauses. The
+        elements of uninterpreted sorts are represented by skolem
+        constants. """
+        facts = slv.model_facts(h,lambda sym: not self.is_state_symbol(sym),clauses,upclose=True)
+        elems = dict((c.rep,il.Constant(c.rep.prefix('__')))
+                     for s in h.sorts() if not il.is_interpreted_sort(s) for c in h.sort_universe(s))
+        return ilu.substitute_constants_clauses(facts,elems)
+    def bad_diagram(self,i):
+        """ Returns the diagram of a bad state in frame i, or None """
+        for bad in self.bad:
+            clauses = ilu.and_clauses(self.frame(i),bad)
+            h = self.model(clauses)
+            if h is not None:
+                return self.diagram(clauses,h)
+        return None
+    def lemma(self,core):
+        """ Returns a lemma excluding the states satisfying core """
+        elems = sorted(set(sym for sym in ilu.used_symbols_clauses(core) if tr.is_skolem(sym)),key=str)
+        rn = dict((sym,il.Variable('V'+str(idx),sym.sort)) for idx,sym in enumerate(elems))
+        fmlas = ilu.substitute_constants_clauses(core,rn).fmlas
+        return il.Or(*[ilu.negate(f) for f in fmlas])
+    def block(self,diag,i):
+        """ Blocks diagram diag in frame i. Returns the length of an
+        abstract counterexample if this fails, else None. """
+        queue = [(i,self.counter,diag,0)]
+        while queue:
+            i,_,diag,dist = heapq.heappop(queue)
+            if i == 0:
+                return dist
+            post_diag = ilu.rename_clauses(diag,self.post)
+            pre = ilu.and_clauses(self.frame(i-1),self.trans)
+            clauses = ilu.and_clauses(pre,post_diag)
+            h = self.model(clauses)
+            if h is not None:
+                self.counter += 1
+                heapq.heappush(queue,(i-1,self.counter,self.diagram(clauses,h),dist+1))
+                heapq.heappush(queue,(i,self.counter,diag,dist))
+                continue
+            core = slv.unsat_core(post_diag,pre)
+            inv_post = dict((y,x) for x,y in self.post.items())
+            core = ilu.rename_clauses(core,inv_post)
+            if self.model(ilu.and_clauses(self.init,core)) is not None:
+                # keep the literals needed to exclude the initial states
+                init_core = slv.unsat_core(diag,self.init)
+                if init_core is None:
+                    return dist # diag contains an initial state
+                core = ilu.Clauses(core.fmlas+[f for f in init_core.fmlas if f not in core.fmlas])
+            self.add_lemma(self.lemma(core),i)
+        return None
+    def add_lemma(self,lemma,i):
+        for idx,(l,j) in enumerate(self.lemmas):
+            if l == lemma:
+                self.lemmas[idx] = (l,max(i,j))
+                return
+        self.lemmas.append((lemma,i))
+    def propagate(self):
+        """ Pushes lemmas forward to the next frame. Returns the
+        inductive invariant if two frames are equal, else None. """
+        for i in range(1,self.n_frames):
+            idxs = [idx for idx,(l,j) in enumerate(self.lemmas) if j == i]
+            pre = ilu.and_clauses(self.frame(i),self.trans)
+            posts = [ilu.rename_clauses(ilu.Clauses([self.lemmas[idx][0]]),self.post) for idx in idxs]
+            oks = slv.clauses_imply_list(pre,posts)
+            for idx,ok in zip(idxs,oks):
+                if ok:
+                    self.lemmas[idx] = (self.lemmas[idx][0],i+1)
+            if all(oks):
+                return [l for l,j in self.lemmas if j >= i]
+        return None
+    def run(self,max_frames=None):
+        """ Returns an inductive invariant, or an integer, the length
+        of an abstract counterexample, or None if max_frames is
+        reached """
+        if self.bad_diagram(0) is not None:
+            return 0
+        while max_frames is None or self.n_frames <= max_frames:
+            print('PDR frame {}...'.format(self.n_frames))
+            while True:
+                diag = self.bad_diagram(self.n_frames)
+                if diag is None:
+                    break
+                dist = self.block(diag,self.n_frames)
+                if dist is not None:
+                    return dist
+            self.n_frames += 1
+            inv = self.propagate()
+            if inv is not None:
+                return inv
+        return None
+
+def check_isolate(max_frames=None):
+    step_action = ia.env_action(None)
+    conj,clauses = ivy_bmc.negated_conjectures()
+    ag,post = ivy_bmc.initial_state()
+    init = ag.get_history(post).post
+    update = step_action.update(im.module,{})
+    pdr = PDR(init,update,im.module.background_theory(),clauses)
+    with ivy_profile.ProfileContext(action='pdr'):
+        res = pdr.run(max_frames)
+    if isinstance(res,list):
+        print('PDR found an inductive invariant:')
+        for lemma in res:
+            print('    invariant {}'.format(lemma))
+        return None
+    if res is None:
+        return 'PDR reached the bound of {} frames without finding an invariant.'.format(max_frames)
+    print('PDR found an abstract counterexample of length {}. Checking it with BMC...'.format(res))
+    cex = ivy_bmc.check_incremental(ag,post,step_action,clauses,pdr.n_frames)
+    if cex is not None:
+        n,trace = cex
+        print('BMC found a counter-example of depth {}...'.format(n))
+        print()
+        return trace
+    return 'PDR found no universally quantified inductive invariant.'
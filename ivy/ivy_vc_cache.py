@@ -0,0 +1,128 @@
+#
+# Copyright (c) Microsoft Corporation. All Rights Reserved.
+#
+""" Persistent cache of verification condition results.
+
+A verification condition is identified by a fingerprint, which is a
+hash of the text of its clauses (including the background theory),
+the sorts of the symbols and the theory interpretations, together
+with the relevant solver parameters. Only unsatisfiable results are
+stored, since a satisfiable result is needed to produce a
+counterexample. Entries are stored one per file in a
+content-addressed directory, so concurrent runs can share a cache.
+
+To report invalidations, the fingerprint last stored for each check
+site (the isolate, action and line of an assertion) is also recorded.
+A miss at a site with a recorded fingerprint means that the cached
+result was invalidated by a change.
+"""
+
+from . import ivy_utils as iu
+from . import ivy_logic
+from . import ivy_logic_utils as lu
+
+import hashlib
+import os
+import tempfile
+
+opt_vc_cache = iu.BooleanParameter("vc_cache",False)
+opt_vc_cache_dir = iu.Parameter("vc_cache_dir",".ivy_cache")
+
+hits = 0
+misses = 0
+stores = 0
+invalidations = 0
+
+def enabled():
+    return opt_vc_cache.get()
+
+def theory_text():
+    return ''.join('{}={};'.format(name,ivy_logic.sig.interp[name]) for name in sorted(ivy_logic.sig.interp))
+
+def clauses_text(clauses):
+    syms = lu.used_symbols_clauses(clauses)
+    sorts = ''.join('{}:{};'.format(sym.name,sym.sort) for sym in sorted(syms,key=lambda s:s.name))
+    return repr(clauses) + '\n' + sorts
+
+class Fingerprint(object):
+    """ Incrementally computed fingerprint of a sequence of clause
+    sets. The params are the solver parameters that affect the result. """
+    def __init__(self,params):
+        self.hash = hashlib.sha256()
+        self.hash.update(repr(sorted(params.items())).encode('utf-8'))
+        self.hash.update(theory_text().encode('utf-8'))
+    def add(self,clauses):
+        self.hash.update(clauses_text(clauses).encode('utf-8'))
+        self.hash.update(b'\0')
+    def extend(self,clauses):
+        """ Returns a new fingerprint with clauses added """
+        res = Fingerprint.__new__(Fingerprint)
+        res.hash = self.hash.copy()
+        res.add(clauses)
+        return res
+    def key(self):
+        return self.hash.hexdigest()
+
+def entry_path(key):
+    return os.path.join(opt_vc_cache_dir.get(),key[:2],key[2:])
+
+def site_path(site):
+    key = hashlib.sha256(site.encode('utf-8')).hexdigest()
+    return os.path.join(opt_vc_cache_dir.get(),'sites',key[:2],key[2:])
+
+def write_file(path,text):
+    """ Atomically writes text to path, creating its directory """
+    dir = os.path.dirname(path)
+    try:
+        os.makedirs(dir,exist_ok=True)
+        fd,tmp = tempfile.mkstemp(dir=dir)
+        with os.fdopen(fd,'w') as f:
+            f.write(text)
+        os.replace(tmp,path)
+        return True
+    except OSError as e:
+        iu.warn(None,'cannot write VC cache entry {}: {}'.format(path,e))
+        return False
+
+def lookup(fp,site=None):
+    """ Returns true if the VC with fingerprint fp is known to be
+    unsat. The site, if given, is the text identifying the check. """
+    global hits, misses, invalidations
+    if os.path.exists(entry_path(fp.key())):
+        hits += 1
+        return True
+    misses += 1
+    if site is not None:
+        try:
+            with open(site_path(site)) as f:
+                if f.read().strip() != fp.key():
+                    invalidations += 1
+        except OSError:
+            pass
+    return False
+
+def store(fp,site=None):
+    """ Records that the VC with fingerprint fp is unsat """
+    global stores
+    if write_file(entry_path(fp.key()),'unsat\n'):
+        stores += 1
+        if site is not None:
+            write_file(site_path(site),fp.key() + '\n')
+
+def reset_stats():
+    global hits, misses, stores, invalidations
+    hits = misses = stores = invalidations = 0
+
+def get_stats():
+    return (hits,misses,stores,invalidations)
+
+def add_stats(stats):
+    global hits, misses, stores, invalidations
+    hits += stats[0]
+    misses += stats[1]
+    stores += stats[2]
+    invalidations += stats[3]
+
+def report():
+    if enabled():
+        print('VC cache: {} hits, {} misses ({} invalidated), {} new entries'.format(hits,misses,invalidations,stores))
@@ -15,13 +15,62 @@ Iterating over a recstruct iterates only over its sub-structures.
 
 Subclasses of recstruct's can set __slots__ = () to save memory.
 
-Hash-consing can be added later as an option.
+Hash-consing is enabled by calling set_hash_consing(True). After
+this, constructing a recstruct equal to an existing one returns the
+existing object, which carries a cached hash. The table of
+hash-consed objects is weak-valued, so objects are reclaimed when no
+longer used. Two hash-consed objects are equal exactly when they are
+identical, so equality tests on them take constant time. Objects
+created while hash-consing is off (or unpickled) are not shared,
+but still compare structurally.
 
 """
 
 import sys as _sys
+import weakref as _weakref
 from keyword import iskeyword as _iskeyword
 
+_hash_consing = False
+_table = _weakref.WeakValueDictionary()
+
+
+def set_hash_consing(on):
+    """
+    Turns hash-consing of newly constructed recstructs on or off.
+    """
+    global _hash_consing
+    _hash_consing = bool(on)
+    # When off, construction uses the plain type.__call__, so that it
+    # costs nothing more than without hash-consing.
+    _RecstructType.__call__ = _interning_call if _hash_consing else type.__call__
+
+
+def hash_consing():
+    return _hash_consing
+
+
+def _interning_call(cls, *args, **kwargs):
+    obj = type.__call__(cls, *args, **kwargs)
+    try:
+        key = (cls, obj._tup)
+        res = _table.get(key)
+        if res is None:
+            obj._hash = obj._tup.__hash__()
+            _table[key] = res = obj
+    except TypeError:
+        return obj # unhashable fields
+    return res
+
+
+class _RecstructType(type):
+    """
+    Metaclass of recstructs that implements hash-consing. While
+    hash-consing is on, its __call__ is _interning_call, which
+    constructs the object as usual (so that subclasses may override
+    __init__) and then replaces it with the shared copy, if any.
+    """
+    pass
+
 
 def _init(self, *args):
     self._tup = args
@@ -32,9 +81,9 @@ def _itemgetter(x):
 
 
 _class_template = '''\
-class {typename}(object):
+class {typename}(object, metaclass=_RecstructType):
 
-    __slots__ = ('_tup')
+    __slots__ = ('_tup', '_hash', '__weakref__')
 
     _meta_fields = {meta_field_names!r}
     _sub_fields = {sub_field_names!r}
@@ -54,13 +103,20 @@ class {typename}(object):
 
     def __init__(self, {meta_arg_list_with_defaults}{sub_arg_list}):
         self._tup = tuple(type(self)._preprocess_({meta_arg_list}{sub_arg_list}))
+        self._hash = None
 
     def __repr__(self):
         """Return a nicely formatted representation string"""
         return type(self).__name__ + repr(self._tup)
 
     def __eq__(self, other):
-        return type(self) is type(other) and (self._tup) == (other._tup)
+        if self is other:
+            return True
+        if type(self) is not type(other):
+            return False
+        if self._hash is not None and other._hash is not None:
+            return False # distinct hash-consed objects
+        return (self._tup) == (other._tup)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -79,7 +135,8 @@ class {typename}(object):
 
     def __hash__(self):
         #return hash((type(self), ) + self._tup)
-        return self._tup.__hash__()
+        h = self._hash
+        return self._tup.__hash__() if h is None else h
 
     def _subs(self):
         return self._tup[{n_meta}:]
@@ -107,6 +164,7 @@ class {typename}(object):
 
     def __setstate__(self, state):
         self._tup = state['_tup']
+        self._hash = None
 
 {field_defs}
 '''
@@ -203,6 +261,7 @@ def recstruct(typename, meta_field_names, sub_field_names, verbose=False):
         _itemgetter=_itemgetter,
         _property=property,
         _init=_init,
+        _RecstructType=_RecstructType,
     )
     try:
         exec(class_definition, namespace)
@@ -9,6 +9,12 @@ Ideally, this file should be the only file to improt the z3 module
 
 import ivy.z3 as z3
 
+from . import ivy_utils as iu
+
+import atexit
+import collections
+import dbm
+import hashlib
 
 from .logic import (Var, Const, Apply, Eq, Ite, Not, And, Or, Implies,
                    Iff, ForAll, Exists)
@@ -103,7 +109,94 @@ def _to_z3(x):
         assert False, type(x)
 
 
-_implies_cache = {}
+# Implication results are cached in memory, in an LRU cache holding at
+# most implies_cache_size entries (zero means no limit). With
+# implies_cache_file=<file>, they are also stored in a database file,
+# so they survive restarts. Only definite results are cached.
+
+opt_implies_cache_size = iu.Parameter("implies_cache_size",100000,process=int)
+opt_implies_cache_file = iu.Parameter("implies_cache_file","")
+
+_implies_cache = collections.OrderedDict()
+_implies_db = None
+
+hits = 0
+misses = 0
+
+
+def term_text(x):
+    """
+    Canonical text of a term, with bound variables sorted, used as
+    the key of the database.
+    """
+    if type(x) in (Var, Const):
+        return repr(x)
+    elif type(x) is Apply:
+        return 'Apply({})'.format(','.join([repr(x.func)] + [term_text(t) for t in x.terms]))
+    elif type(x) in _z3_quantifiers:
+        variables = sorted(x.variables, key=repr)
+        return '{}([{}],{})'.format(type(x).__name__, ','.join(repr(v) for v in variables), term_text(x.body))
+    elif type(x) in _z3_operators:
+        return '{}({})'.format(type(x).__name__, ','.join(term_text(y) for y in x))
+    else:
+        return repr(x)
+
+
+def _db_key(key):
+    text = term_text(key[0]) + '\0' + term_text(key[1])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _get_db():
+    global _implies_db
+    if _implies_db is None and opt_implies_cache_file.get():
+        try:
+            _implies_db = dbm.open(opt_implies_cache_file.get(), 'c')
+        except (dbm.error[0], OSError) as e:
+            iu.warn(None, 'cannot open implication cache {}: {}'.format(opt_implies_cache_file.get(), e))
+            opt_implies_cache_file.set("")
+            return None
+        atexit.register(_implies_db.close)
+    return _implies_db
+
+
+def _cache_lookup(key):
+    """
+    Returns the cached result of key = (f1, f2), or None.
+    """
+    global hits, misses
+    if key in _implies_cache:
+        _implies_cache.move_to_end(key)
+        hits += 1
+        return _implies_cache[key]
+    db = _get_db()
+    if db is not None:
+        val = db.get(_db_key(key))
+        if val is not None:
+            hits += 1
+            res = val == b'1'
+            _cache_store(key, res, False)
+            return res
+    misses += 1
+    return None
+
+
+def _cache_store(key, res, persist=True):
+    _implies_cache[key] = res
+    size = opt_implies_cache_size.get()
+    while size and len(_implies_cache) > size:
+        _implies_cache.popitem(last=False)
+    db = _get_db() if persist else None
+    if db is not None:
+        db[_db_key(key)] = b'1' if res else b'0'
+
+
+def implies_cache_stats():
+    """
+    Returns the number of hits, misses and entries of the implication
+    cache.
+    """
+    return (hits, misses, len(_implies_cache))
 
 
 def z3_implies(f1, f2, timeout=False):
@@ -111,8 +204,9 @@ def z3_implies(f1, f2, timeout=False):
     Use z3 to test if f1 imples f2
     """
     key = (f1, f2)
-    if key in _implies_cache:
-        return _implies_cache[key]
+    cached = _cache_lookup(key)
+    if cached is not None:
+        return cached
     s = z3.Solver()
     if timeout:
         s.set("timeout", 2000) # 2 seconds
@@ -121,10 +215,10 @@ def z3_implies(f1, f2, timeout=False):
     s.add(to_z3(Not(f2)))
     res = s.check()
     if res == z3.sat:
-        _implies_cache[key] = False
+        _cache_store(key, False)
         return False
     elif res == z3.unsat:
-        _implies_cache[key] = True
+        _cache_store(key, True)
         return True
     else:
         # no caching of unknown results
@@ -150,18 +244,19 @@ def z3_implies_batch(premise, formulas, timeout=False):
     result = []
     for f in formulas:
         key = (premise, f)
-        if key in _implies_cache:
-            result.append(_implies_cache[key])
+        cached = _cache_lookup(key)
+        if cached is not None:
+            result.append(cached)
         else:
             s.push()
             s.add(to_z3(Not(f)))
             res = s.check()
             s.pop()
             if res == z3.sat:
-                _implies_cache[key] = False
+                _cache_store(key, False)
                 result.append(False)
             elif res == z3.unsat:
-                _implies_cache[key] = True
+                _cache_store(key, True)
                 result.append(True)
             else:
                 # no caching of unknown results
@@ -0,0 +1,75 @@
+
+from ivy import ivy_module as im
+from ivy import ivy_logic as il
+from ivy import ivy_mc
+import io
+import itertools
+
+# Decoder for the binary AIGER format, independent of ivy_mc
+
+def read_aig(data):
+    f = io.BytesIO(data)
+    M,I,L,O,A = map(int,f.readline().split()[1:])
+    latches = [int(f.readline()) for i in range(L)]
+    outputs = [int(f.readline()) for i in range(O)]
+    def number():
+        res,shift = 0,0
+        while True:
+            byte = f.read(1)[0]
+            res |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                return res
+    gates = []
+    for i in range(A):
+        lhs = 2 * (I + L + i + 1)
+        rhs0 = lhs - number()
+        rhs1 = rhs0 - number()
+        gates.append((lhs,rhs0,rhs1))
+    assert f.read() == b''
+    return M,I,L,A,latches,outputs,gates
+
+def evaluate(gates,vals,lit):
+    """ Value of literal lit, given the values of the inputs and latches """
+    vals = dict(vals)
+    for out,in0,in1 in gates:
+        vals[out] = value(vals,in0) & value(vals,in1)
+    return value(vals,lit)
+
+def value(vals,lit):
+    return (lit & 1) ^ (vals[lit & ~1] if lit > 1 else 0)
+
+with im.Module():
+    sym = lambda name: il.Symbol(name,il.find_sort('bool'))
+    ins = [sym('a'),sym('b'),sym('c')]
+    lts = [sym('l'),sym('m')]
+    outs = [sym('o')]
+    aiger = ivy_mc.Aiger(ins,lts,outs)
+    a,b,c,l,m = [aiger.lit(x) for x in ins + lts]
+    aiger.set(lts[0],aiger.xor(a,l))
+    aiger.set(lts[1],aiger.ite(b,m,aiger.orl(c,l)))
+    aiger.set(outs[0],aiger.andl(l,m,aiger.iff(a,c)))
+    # make some gates whose deltas need more than one byte
+    x = a
+    for i in range(100):
+        x = aiger.orl(aiger.and2(x,b),aiger.and2(aiger.notl(x),c))
+    aiger.set(outs[0],aiger.orl(aiger.values[outs[0]],aiger.and2(x,a)))
+
+    f = io.BytesIO()
+    aiger.write_binary(f)
+    M,I,L,A,latches,outputs,gates = read_aig(f.getvalue())
+
+    assert I == len(aiger.inputs) and L == len(lts) and A == len(aiger.gates)
+    assert M == I + L + A
+    assert any(y - z >= 0x80 for x,y,z in gates)
+    assert latches == [aiger.values[x] for x in lts]
+    assert outputs == [aiger.values[x] for x in outs]
+
+    # the decoded gates compute the same functions as the original ones
+
+    nvars = I + L
+    for bits in itertools.product([0,1],repeat=nvars):
+        vals = dict((2*(i+1),bit) for i,bit in enumerate(bits))
+        for lit in latches + outputs:
+            assert evaluate(gates,vals,lit) == evaluate(aiger.gates,vals,lit)
+print('OK')
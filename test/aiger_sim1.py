@@ -0,0 +1,82 @@
+
+from ivy import ivy_module as im
+from ivy import ivy_logic as il
+from ivy import ivy_mc
+import numpy as np
+import random
+
+def scalar_run(aiger,inputs):
+    """ Simulates aiger one gate at a time on a sequence of input
+    strings, returning the latch and output values at each step """
+    aiger.reset()
+    aiger.sim = None
+    res = []
+    for inp in inputs:
+        aiger.step(inp)
+        res.append((aiger.latch_vals(),''.join(aiger.getin(aiger.values[x]) for x in aiger.outputs)))
+        next(aiger)
+    return res
+
+with im.Module():
+    sym = lambda name: il.Symbol(name,il.find_sort('bool'))
+
+    # The lanes of AigerSim agree with Aiger.step on a random circuit
+
+    rnd = random.Random(0)
+    ins = [sym('i{}'.format(i)) for i in range(4)]
+    lts = [sym('l{}'.format(i)) for i in range(3)]
+    outs = [sym('o{}'.format(i)) for i in range(2)]
+    aiger = ivy_mc.Aiger(ins,lts,outs)
+    lits = [aiger.lit(x) for x in ins + lts]
+    for i in range(60):
+        x,y = rnd.sample(lits,2)
+        lits.append(aiger.and2(x ^ rnd.randint(0,1),y ^ rnd.randint(0,1)))
+    for x in lts + outs:
+        aiger.set(x,rnd.choice(lits[-20:]) ^ rnd.randint(0,1))
+
+    words,steps = 2,8
+    sim = ivy_mc.AigerSim(aiger,words)
+    sim.reset()
+    rng = np.random.default_rng(0)
+    shifts = np.arange(64,dtype=np.uint64)
+    def lanes(lits):
+        """ Values of a list of literals in each lane, as strings """
+        bits = np.array([(sim.value(x)[:,None] >> shifts) & 1 for x in lits]).reshape((len(lits),words*64))
+        return [''.join(str(int(b)) for b in bits[:,lane]) for lane in range(words*64)]
+    trace = []
+    for k in range(steps):
+        inputs = np.frombuffer(rng.bytes(8*len(aiger.inputs)*words),dtype=np.uint64)
+        inputs = inputs.reshape((len(aiger.inputs),words))
+        sim.step(inputs)
+        trace.append((lanes([aiger.map[x] for x in aiger.inputs]),
+                      lanes([aiger.map[x] for x in lts]),
+                      lanes([aiger.values[x] for x in outs])))
+        sim.next()
+    for lane in range(words*64):
+        expected = scalar_run(aiger,[inp[lane] for inp,_,_ in trace])
+        assert expected == [(lt[lane],out[lane]) for _,lt,out in trace]
+
+    # A shift register that fails after n steps, unless the dead latch
+    # is set, which happens with probability 7/8 in each step. Random
+    # sequences all die, but with reseeding the failure is found, and
+    # the trace is a real counterexample.
+
+    n = 12
+    ins = [sym('j{}'.format(i)) for i in range(3)]
+    chain = [sym('c{}'.format(i)) for i in range(n)]
+    d = sym('dead')
+    aiger = ivy_mc.Aiger(ins,chain + [d],[sym('bad')])
+    dead = aiger.lit(d)
+    aiger.set(chain[0],1)
+    for x,y in zip(chain,chain[1:]):
+        aiger.set(y,aiger.lit(x))
+    aiger.set(d,aiger.orl(dead,aiger.notl(aiger.andl(*[aiger.lit(x) for x in ins]))))
+    aiger.set(sym('bad'),aiger.and2(aiger.lit(chain[-1]),aiger.notl(dead)))
+
+    assert ivy_mc.random_simulation(aiger,n+2,64) is None
+    cex = ivy_mc.random_simulation(aiger,n+2,64,dead=dead)
+    assert cex is not None and len(cex) == n + 1
+    run = scalar_run(aiger,cex)
+    assert all(lt[-1] == '0' for lt,_ in run)
+    assert run[-1][1] == '1' and all(out == '0' for _,out in run[:-1])
+print('OK')
@@ -0,0 +1,33 @@
+
+from ivy import ivy_module as im
+from ivy import ivy_logic as il
+from ivy import ivy_mc
+
+with im.Module():
+    sym = lambda name: il.Symbol(name,il.find_sort('bool'))
+    aiger = ivy_mc.Aiger([sym('a'),sym('b')],[],[])
+    a,b = aiger.lit(sym('a')),aiger.lit(sym('b'))
+    na,nb = aiger.notl(a),aiger.notl(b)
+
+    # constants and trivial conjunctions make no gates
+
+    assert aiger.and2(a,a) == a
+    assert aiger.and2(na,na) == na
+    assert aiger.and2(a,na) == 0 and aiger.and2(na,a) == 0
+    assert aiger.and2(a,0) == 0 and aiger.and2(0,a) == 0
+    assert aiger.and2(a,1) == a and aiger.and2(1,a) == a
+    assert aiger.and2(0,1) == 0 and aiger.and2(1,1) == 1 and aiger.and2(0,0) == 0
+    assert aiger.gates == []
+
+    # a gate with the same inputs, in either order, is shared
+
+    g = aiger.and2(a,nb)
+    assert aiger.and2(nb,a) == g and aiger.and2(a,nb) == g
+    assert len(aiger.gates) == 1
+    assert aiger.and2(g,g) == g and aiger.and2(g,aiger.notl(g)) == 0
+    assert aiger.orl(na,b) == aiger.notl(g)
+    assert len(aiger.gates) == 1
+    h = aiger.and2(na,nb)
+    assert h != g and len(aiger.gates) == 2
+    assert aiger.gates == [(g,a,nb),(h,na,nb)]
+print('OK')
@@ -0,0 +1,50 @@
+
+from ivy.ivy_core import biased_core
+import ivy.z3 as z3
+import random
+
+def is_sat(s,lits):
+    return s.check(lits) == z3.sat
+
+def check_mus(s,core):
+    """ core is unsat and removing any literal makes it sat """
+    assert not is_sat(s,core)
+    for i in range(len(core)):
+        assert is_sat(s,core[:i] + core[i+1:])
+
+# The minimal unsat subsets are {x1,x2}, {x1,x5} and {x3,x4,x5}
+
+x = [z3.Bool('x{}'.format(i)) for i in range(7)]
+s = z3.Solver()
+s.add(z3.Not(z3.And(x[1],x[2])))
+s.add(z3.Not(z3.And(x[1],x[5])))
+s.add(z3.Not(z3.And(x[3],x[4],x[5])))
+
+core = biased_core(s,x,[x[1]])
+check_mus(s,core)
+assert set(map(str,core)) == {'x3','x4','x5'}
+
+core = biased_core(s,x,[x[3],x[5]])
+check_mus(s,core)
+assert set(map(str,core)) == {'x1','x2'}
+
+core = biased_core(s,x,[])
+check_mus(s,core)
+
+# Random sets of clauses over the literals
+
+rnd = random.Random(0)
+for i in range(50):
+    s = z3.Solver()
+    for j in range(6):
+        s.add(z3.Or([z3.Not(y) for y in rnd.sample(x,rnd.randint(1,4))]))
+    if is_sat(s,x):
+        continue
+    unlikely = rnd.sample(x,2)
+    core = biased_core(s,x,unlikely)
+    check_mus(s,core)
+    # if some unsat subset avoids the unlikely literals, so does the core
+    names = set(map(str,unlikely))
+    if not is_sat(s,[y for y in x if str(y) not in names]):
+        assert not any(str(y) in names for y in core)
+print('OK')
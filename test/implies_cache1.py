@@ -0,0 +1,49 @@
+
+from ivy import ivy_utils as iu
+from ivy import z3_utils as zu
+from ivy.logic import Const, Boolean, And, Or, Not
+import os
+import subprocess
+import sys
+import tempfile
+
+p,q,r = (Const(n,Boolean) for n in 'pqr')
+queries = [(And(p,q),p),(p,And(p,q)),(Or(p,q),Or(q,p)),(And(p,Not(p)),r)]
+
+if len(sys.argv) > 1:
+
+    # A second run with the same database file: all hits, and the
+    # results are the same.
+
+    iu.set_parameters({'implies_cache_file':sys.argv[1]})
+    assert [zu.z3_implies(f1,f2) for f1,f2 in queries] == [True,False,True,True]
+    assert zu.implies_cache_stats() == (4,0,4)
+    print('OK')
+    sys.exit(0)
+
+# Eviction is least recently used first, counting hits as uses.
+
+iu.set_parameters({'implies_cache_size':'2'})
+a,b,c = queries[:3]
+assert zu.z3_implies(*a) and not zu.z3_implies(*b)
+assert zu.implies_cache_stats() == (0,2,2)
+assert zu.z3_implies(*a)
+assert zu.implies_cache_stats() == (1,2,2)
+assert zu.z3_implies(*c)
+assert list(zu._implies_cache) == [a,c]
+assert zu.implies_cache_stats() == (1,3,2)
+assert not zu.z3_implies(*b)
+assert list(zu._implies_cache) == [c,b]
+assert zu.implies_cache_stats() == (1,4,2)
+assert zu.z3_implies_batch(c[0],[c[1],a[1]]) == [True,False]
+assert zu.implies_cache_stats() == (2,5,2)
+
+# The results are stored in the database file and found by the next
+# run.
+
+dbfile = os.path.join(tempfile.mkdtemp(),'implies')
+zu._implies_cache.clear()
+iu.set_parameters({'implies_cache_file':dbfile})
+assert [zu.z3_implies(f1,f2) for f1,f2 in queries] == [True,False,True,True]
+zu._implies_db.close()
+subprocess.check_call([sys.executable,__file__,dbfile])
@@ -0,0 +1,46 @@
+
+from ivy import ivy_utils as iu
+from ivy import ivy_solver as islv
+import ivy.z3 as z3
+import tempfile
+
+# A satisfiable quantified query
+
+x = z3.Int('x')
+f = z3.Function('f',z3.IntSort(),z3.IntSort())
+g = z3.Function('g',z3.IntSort(),z3.IntSort())
+s = z3.Solver()
+s.add(z3.ForAll([x],f(x) >= g(x)))
+s.add(g(3) == 4)
+s.add(f(3) < 5)
+
+iu.set_parameters({'portfolio':'2','vc_cache_dir':tempfile.mkdtemp()})
+
+# Race two configurations that differ from the defaults. The answer
+# is sat, so the query is solved again in the parent with the winning
+# configuration to get a model.
+
+configs = [{'smt.random_seed':7},{'smt.mbqi':False,'smt.relevancy':0}]
+islv.portfolio_configs = lambda k: configs
+assert islv.decide(s) == z3.sat
+assert s.model().eval(f(3)).as_long() == 4
+key = islv.portfolio_key(s,None)
+winner = islv.portfolio_winners[key]
+assert winner in configs
+
+# The assumption literals are part of the key.
+
+p = z3.Bool('p')
+assert islv.portfolio_key(s,[p]) != key
+
+# The winners are written at the end of the run, and the next run
+# uses the recorded winner without racing.
+
+islv.write_portfolio_winners()
+islv.portfolio_winners = None
+def no_race(k):
+    assert False,"recorded winner not used"
+islv.portfolio_configs = no_race
+assert islv.decide(s) == z3.sat
+assert islv.get_portfolio_winners()[key] == winner
+print('OK')
@@ -50,6 +50,14 @@ checks = [
           ['oddeven4','OK'],
           ['learning_switch1','trace=true','learning_switch1.ivy: line 37:'],
           ['ded1','OK'],
+          ['pdr1','OK'],
+          ['pdr2','BMC found a counter-example of depth 4'],
+          ['bmc1','OK'],
+          ['bmc1','incremental_bmc=true','OK'],
+          ['bmc2','BMC with bound 4 found a counter-example'],
+          ['bmc2','incremental_bmc=true','BMC with bound 4 found a counter-example'],
+          ['kind1','OK'],
+          ['kind2','The inductive step does not hold for k = 1'],
       ]
     ],
     ['../doc/examples/testing',
@@ -69,6 +77,7 @@ checks = [
       ['arrayset3','OK'],
       ['arrayset','OK'],
       ['client_server_example','OK'],
+      ['client_server_example_pdr','OK'],
       ['counter_example','counter_example.ivy: line 54: guarantee ... FAIL'],
       ['coveragefail','error: Some assertions are not checked'],
       ['helloworld','OK'],
@@ -98,6 +107,17 @@ checks = [
       ['list_reverse','OK'],
       ['indexset','OK'],
       ['number_theory','OK'],
+      ['leader_election_ring_btw','jobs=2','leader_election_ring_btw.ivy: line 118: guarantee ... FAIL'],
+      ['leader_election_ring_repl','jobs=2','OK'],
+      ['leader_election_ring_udp','jobs=2','OK'],
+      ['counter_example','vc_jobs=2','counter_example.ivy: line 54: guarantee ... FAIL'],
+      ['leader_election_ring','vc_jobs=2','leader_election_ring.ivy: line 114: guarantee ... FAIL'],
+      ['arrayset2','vc_jobs=2','OK'],
+      ['counter_example','trace=true','counter_example.ivy: line 54: guarantee ... FAIL'],
+      ['leader_election_ring_btw','trace=true','leader_election_ring_btw.ivy: line 118: guarantee ... FAIL'],
+      ['list_reverse','update_cache=true','OK'],
+      ['client_server_example','update_cache=true','OK'],
+      ['leader_election_ring','update_cache=true','leader_election_ring.ivy: line 114: guarantee ... FAIL'],
       ]
      ],
     ['../examples/ivy',
@@ -0,0 +1,59 @@
+
+from ivy import ivy_module as im
+from ivy.ivy_compiler import ivy_from_string
+from ivy import ivy_utils as iu
+from ivy import ivy_check as ick
+from ivy import ivy_solver as islv
+
+prog = """#lang ivy1.7
+
+type t
+relation le(X:t,Y:t)
+
+axiom le(X,X)
+axiom le(X,Y) & le(Y,Z) -> le(X,Z)
+axiom le(X,Y) & le(Y,X) -> X = Y
+axiom le(X,Y) | le(Y,X)
+
+var lo : t
+var hi : t
+
+after init {
+    hi := lo
+}
+
+action up(x:t) = {
+    require le(hi,x);
+    hi := x
+}
+
+action down(x:t) = {
+    require le(x,lo);
+    lo := x
+}
+
+action both(x:t,y:t) = {
+    require le(y,lo) & le(hi,x);
+    lo := y;
+    hi := x
+}
+
+export up
+export down
+export both
+
+invariant le(lo,hi)
+"""
+
+# With shared_theory, the axioms are translated once and the checks
+# of the three actions share the solver.
+
+iu.set_parameters({'shared_theory':'true'})
+
+with im.Module():
+    ivy_from_string(prog,create_isolate=False)
+    ick.check_module()
+
+assert islv.shared_theory_uses >= 3
+assert islv.shared_theory_builds < islv.shared_theory_uses
+print('OK')
@@ -0,0 +1,67 @@
+
+from ivy import ivy_module as im
+from ivy.ivy_compiler import ivy_from_string
+from ivy import ivy_utils as iu
+from ivy import ivy_check as ick
+from ivy import ivy_vc_cache
+import tempfile
+
+prog = """#lang ivy1.7
+
+type client
+type server
+
+relation link(X:client, Y:server)
+relation semaphore(X:server)
+
+after init {
+    semaphore(W) := true;
+    link(X,Y) := false
+}
+
+action connect(x:client,y:server) = {
+  require semaphore(y);
+  link(x,y) := true;
+  semaphore(y) := false
+}
+
+action disconnect(x:client,y:server) = {
+  require link(x,y);
+  link(x,y) := false;
+  semaphore(y) := true
+}
+
+export connect
+export disconnect
+
+invariant link(X,Y) & link(Z,Y) -> X = Z
+invariant ~(link(X,Y) & semaphore(Y))
+"""
+
+# the same program, with the second invariant edited
+
+edited = prog.replace("invariant ~(link(X,Y) & semaphore(Y))",
+                      "invariant link(X,Y) -> ~semaphore(Y)")
+
+def check(text):
+    ivy_vc_cache.reset_stats()
+    with im.Module():
+        ivy_from_string(text,create_isolate=False)
+        ick.check_module()
+    return ivy_vc_cache.get_stats()
+
+cache_dir = tempfile.mkdtemp()
+iu.set_parameters({'vc_cache':'true','vc_cache_dir':cache_dir})
+
+hits,misses,stores,invalidations = check(prog)
+assert hits == 0 and stores > 0 and invalidations == 0
+
+hits,misses,stores,invalidations = check(prog)
+assert hits > 0 and misses == 0
+
+# the checks of the edited invariant are misses at known sites
+
+hits,misses,stores,invalidations = check(edited)
+assert misses > 0 and stores > 0
+assert 0 < invalidations <= misses
+print('OK')